@@ -2,10 +2,16 @@
 FastAPI Backend để lấy dữ liệu từ các bảng database
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional
 from datetime import date, datetime
+from decimal import Decimal
+import asyncio
+import csv
+import io
+import json
 import sys
 import os
 from dotenv import load_dotenv
@@ -26,6 +32,11 @@ from service import (
     CamerasRepository,
     AttendanceRepository
 )
+from service import async_db
+from service.async_db import iterate_db, run_db
+from service.pagination import MAX_PAGE_SIZE
+from service import metrics
+from service import query_cache
 
 app = FastAPI(title="Attendance System API", version="1.0.0")
 
@@ -38,15 +49,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+metrics.install_http_metrics(app, "api")
+async_db.register_metrics()
+
 # Kết nối database khi khởi động
 @app.on_event("startup")
 async def startup_event():
-    """Kết nối database khi khởi động"""
-    db.connect()
+    """Kết nối database khi khởi động (các thread DB khác tự kết nối khi cần)"""
+    await run_db(db.connect)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Đóng kết nối database khi tắt"""
+    async_db.shutdown()
     db.disconnect()
 
 # ===========================================================
@@ -57,14 +72,14 @@ async def shutdown_event():
 async def get_all_teachers():
     """Lấy tất cả giáo viên"""
     try:
-        return TeachersRepository.get_all_teachers()
+        return await run_db(TeachersRepository.get_all_teachers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/teachers/{teacher_id}", response_model=Dict)
 async def get_teacher_by_id(teacher_id: int):
     """Lấy giáo viên theo ID"""
-    teacher = TeachersRepository.get_teacher_by_id(teacher_id)
+    teacher = await run_db(TeachersRepository.get_teacher_by_id, teacher_id)
     if not teacher:
         raise HTTPException(status_code=404, detail="Teacher not found")
     return teacher
@@ -73,10 +88,18 @@ async def get_teacher_by_id(teacher_id: int):
 async def get_teacher_classes(teacher_id: int):
     """Lấy các lớp học của giáo viên"""
     try:
-        return TeachersRepository.get_teacher_classes(teacher_id)
+        return await run_db(TeachersRepository.get_teacher_classes, teacher_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/teachers/{teacher_id}/tree", response_model=Dict)
+async def get_teacher_tree(teacher_id: int):
+    """Lấy giáo viên kèm các lớp học và học sinh của từng lớp"""
+    teacher = await run_db(TeachersRepository.get_teacher_tree, teacher_id)
+    if not teacher:
+        raise HTTPException(status_code=404, detail="Teacher not found")
+    return teacher
+
 # ===========================================================
 # Endpoints cho Classes
 # ===========================================================
@@ -85,14 +108,22 @@ async def get_teacher_classes(teacher_id: int):
 async def get_all_classes():
     """Lấy tất cả lớp học"""
     try:
-        return ClassesRepository.get_all_classes()
+        return await run_db(ClassesRepository.get_all_classes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/classes/overview", response_model=List[Dict])
+async def get_classes_overview():
+    """Lấy tất cả lớp học kèm học sinh và thống kê điểm danh"""
+    try:
+        return await run_db(ClassesRepository.get_classes_overview)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/classes/{class_id}", response_model=Dict)
 async def get_class_by_id(class_id: int):
     """Lấy lớp học theo ID"""
-    class_info = ClassesRepository.get_class_by_id(class_id)
+    class_info = await run_db(ClassesRepository.get_class_by_id, class_id)
     if not class_info:
         raise HTTPException(status_code=404, detail="Class not found")
     return class_info
@@ -101,14 +132,14 @@ async def get_class_by_id(class_id: int):
 async def get_class_students(class_id: int):
     """Lấy học sinh trong lớp"""
     try:
-        return ClassesRepository.get_class_students(class_id)
+        return await run_db(ClassesRepository.get_class_students, class_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/classes/{class_id}/full", response_model=Dict)
 async def get_class_with_students(class_id: int):
     """Lấy lớp học kèm danh sách học sinh"""
-    class_info = ClassesRepository.get_class_with_students(class_id)
+    class_info = await run_db(ClassesRepository.get_class_with_students, class_id)
     if not class_info:
         raise HTTPException(status_code=404, detail="Class not found")
     return class_info
@@ -117,18 +148,26 @@ async def get_class_with_students(class_id: int):
 # Endpoints cho Students
 # ===========================================================
 
-@app.get("/api/students", response_model=List[Dict])
-async def get_all_students():
-    """Lấy tất cả học sinh"""
+@app.get("/api/students", response_model=Dict)
+async def get_all_students(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """Lấy danh sách học sinh theo trang (sắp xếp theo tên)
+    
+    Trả về {"items", "next_cursor", "limit"}; gọi lại với cursor=next_cursor để lấy trang sau.
+    """
     try:
-        return StudentsRepository.get_all_students()
+        return await run_db(StudentsRepository.get_students_page, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/students/{student_id}", response_model=Dict)
 async def get_student_by_id(student_id: int):
     """Lấy học sinh theo ID"""
-    student = StudentsRepository.get_student_by_id(student_id)
+    student = await run_db(StudentsRepository.get_student_by_id, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     return student
@@ -137,7 +176,7 @@ async def get_student_by_id(student_id: int):
 async def get_students_by_class(class_id: int):
     """Lấy học sinh theo lớp"""
     try:
-        return StudentsRepository.get_students_by_class(class_id)
+        return await run_db(StudentsRepository.get_students_by_class, class_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -145,11 +184,19 @@ async def get_students_by_class(class_id: int):
 # Endpoints cho Face Embeddings
 # ===========================================================
 
-@app.get("/api/embeddings", response_model=List[Dict])
-async def get_all_embeddings():
-    """Lấy tất cả embeddings"""
+@app.get("/api/embeddings", response_model=Dict)
+async def get_all_embeddings(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """Lấy embeddings theo trang (mới nhất trước)
+    
+    Trả về {"items", "next_cursor", "limit"}; gọi lại với cursor=next_cursor để lấy trang sau.
+    """
     try:
-        return FaceEmbeddingsRepository.get_all_embeddings()
+        return await run_db(FaceEmbeddingsRepository.get_embeddings_page, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -157,7 +204,7 @@ async def get_all_embeddings():
 async def get_embeddings_by_student(student_id: int):
     """Lấy embeddings của học sinh"""
     try:
-        return FaceEmbeddingsRepository.get_embeddings_by_student(student_id)
+        return await run_db(FaceEmbeddingsRepository.get_embeddings_by_student, student_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -169,14 +216,14 @@ async def get_embeddings_by_student(student_id: int):
 async def get_all_cameras():
     """Lấy tất cả camera"""
     try:
-        return CamerasRepository.get_all_cameras()
+        return await run_db(CamerasRepository.get_all_cameras)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/cameras/{camera_id}", response_model=Dict)
 async def get_camera_by_id(camera_id: int):
     """Lấy camera theo ID"""
-    camera = CamerasRepository.get_camera_by_id(camera_id)
+    camera = await run_db(CamerasRepository.get_camera_by_id, camera_id)
     if not camera:
         raise HTTPException(status_code=404, detail="Camera not found")
     return camera
@@ -185,11 +232,19 @@ async def get_camera_by_id(camera_id: int):
 # Endpoints cho Attendance
 # ===========================================================
 
-@app.get("/api/attendance", response_model=List[Dict])
-async def get_all_attendance():
-    """Lấy tất cả điểm danh"""
+@app.get("/api/attendance", response_model=Dict)
+async def get_all_attendance(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """Lấy điểm danh theo trang (mới nhất trước)
+    
+    Trả về {"items", "next_cursor", "limit"}; gọi lại với cursor=next_cursor để lấy trang sau.
+    """
     try:
-        return AttendanceRepository.get_all_attendance()
+        return await run_db(AttendanceRepository.get_attendance_page, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -197,7 +252,7 @@ async def get_all_attendance():
 async def get_attendance_by_student(student_id: int):
     """Lấy điểm danh của học sinh"""
     try:
-        return AttendanceRepository.get_attendance_by_student(student_id)
+        return await run_db(AttendanceRepository.get_attendance_by_student, student_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -205,7 +260,7 @@ async def get_attendance_by_student(student_id: int):
 async def get_attendance_by_class(class_id: int):
     """Lấy điểm danh của lớp"""
     try:
-        return AttendanceRepository.get_attendance_by_class(class_id)
+        return await run_db(AttendanceRepository.get_attendance_by_class, class_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -213,10 +268,84 @@ async def get_attendance_by_class(class_id: int):
 async def get_attendance_statistics(class_id: int):
     """Lấy thống kê điểm danh của lớp"""
     try:
-        return AttendanceRepository.get_attendance_statistics_by_class(class_id)
+        return await run_db(AttendanceRepository.get_attendance_statistics_by_class, class_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ===========================================================
+# Xuất lịch sử điểm danh (stream, không nạp hết vào bộ nhớ)
+# ===========================================================
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+def _ndjson_chunk(rows: List[Dict]) -> bytes:
+    return "".join(
+        json.dumps(row, ensure_ascii=False, default=_json_default) + "\n" for row in rows
+    ).encode("utf-8")
+
+def _csv_chunk(rows: List[Dict], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+    if header:
+        # BOM để Excel nhận đúng UTF-8 (tên tiếng Việt)
+        buffer.write("\ufeff")
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+@app.get("/api/attendance/export")
+async def export_attendance(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    class_id: Optional[int] = None,
+    student_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[Literal["present", "absent", "late", "excused"]] = None
+):
+    """Xuất lịch sử điểm danh đã lọc dạng NDJSON hoặc CSV, đọc và gửi dần theo từng lô"""
+    chunks = iterate_db(AttendanceRepository.stream_attendance(
+        class_id=class_id,
+        student_id=student_id,
+        start_date=start_date,
+        end_date=end_date,
+        status=status
+    ))
+    # Đọc lô đầu trước khi trả response để lỗi DB (vd. hết kết nối) vẫn trả được mã lỗi
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def body():
+        if first is None:
+            return
+        try:
+            if format == "csv":
+                yield _csv_chunk(first, header=True)
+                async for rows in chunks:
+                    yield _csv_chunk(rows, header=False)
+            else:
+                yield _ndjson_chunk(first)
+                async for rows in chunks:
+                    yield _ndjson_chunk(rows)
+        finally:
+            # Client ngắt giữa chừng: đóng cursor và trả kết nối về pool
+            await chunks.aclose()
+
+    filename = f"attendance_{datetime.now():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        body(),
+        media_type="text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # ===========================================================
 # Health check
 # ===========================================================
@@ -226,14 +355,30 @@ async def root():
     """Health check endpoint"""
     return {"message": "Attendance System API", "status": "running"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics dạng Prometheus: độ trễ Repository, HTTP request, pool kết nối"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Thống kê cache dữ liệu tham chiếu (giáo viên, lớp học, camera): hit/miss, số phần tử"""
+    return query_cache.stats()
+
+# Health check không chờ quá lâu khi mọi thread DB đang bận với query chậm
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "2.0"))
+
 @app.get("/api/health")
 async def health_check():
     """Health check với database"""
+    pool = {"workers": async_db.stats(), "connections": db.stats()}
     try:
-        if db.connection and db.connection.is_connected():
-            return {"status": "healthy", "database": "connected"}
+        if await asyncio.wait_for(run_db(db.ping), timeout=HEALTH_TIMEOUT):
+            return {"status": "healthy", "database": "connected", "db_pool": pool}
         else:
-            return {"status": "unhealthy", "database": "disconnected"}
+            return {"status": "unhealthy", "database": "disconnected", "db_pool": pool}
+    except asyncio.TimeoutError:
+        return {"status": "unhealthy", "database": "busy", "db_pool": pool}
     except:
-        return {"status": "unhealthy", "database": "error"}
+        return {"status": "unhealthy", "database": "error", "db_pool": pool}
 
@@ -0,0 +1,90 @@
+"""
+Đo recall và độ trễ của IVFIndex so với tìm kiếm vét cạn (brute force).
+
+Dữ liệu giả lập: S học sinh, mỗi học sinh K ảnh (embedding 512 chiều quanh một
+tâm riêng của người đó, cosine giữa hai ảnh cùng người khoảng 0.64); truy vấn là
+một ảnh mới của một học sinh. Với --random mỗi vector là ngẫu nhiên độc lập
+(không có cấu trúc theo người), trường hợp xấu nhất của IVF.
+
+Các cột:
+- recall@1: embedding gần nhất trùng với kết quả vét cạn
+- recall@10: tỉ lệ top-10 vét cạn tìm được. Các láng giềng khác người có cosine
+  ~0 (nhiễu) nên IVF chỉ tìm thấy chúng khi quét gần hết dữ liệu
+- match@10: như recall@10 nhưng chỉ tính láng giềng có điểm >= MATCH_SCORE,
+  tức các ảnh thật sự của cùng người — phần quyết định kết quả nhận diện
+
+Chạy:
+    python benchmarks/bench_ann_index.py [số_học_sinh] [số_truy_vấn] [--random]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service.ann_index import IVFIndex
+from service.face_gallery import normalize_rows
+
+PHOTOS_PER_STUDENT = 5
+MATCH_SCORE = 0.3
+
+
+def make_photos(centres: np.ndarray, student_ids: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Ảnh của học sinh = tâm + nhiễu (cosine với tâm khoảng 0.8)"""
+    noise = normalize_rows(rng.standard_normal((len(student_ids), centres.shape[1])))
+    return normalize_rows(centres[student_ids] + 0.75 * noise)
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    unstructured = "--random" in sys.argv
+    n_students = int(args[0]) if len(args) > 0 else 4000
+    n_queries = int(args[1]) if len(args) > 1 else 500
+    rng = np.random.default_rng(42)
+
+    if unstructured:
+        student_ids = np.arange(n_students * PHOTOS_PER_STUDENT)
+        gallery = normalize_rows(rng.standard_normal((len(student_ids), 512)))
+        targets = rng.choice(len(gallery), n_queries, replace=False)
+        queries = normalize_rows(gallery[targets] + 0.9 * normalize_rows(rng.standard_normal((n_queries, 512))))
+    else:
+        centres = normalize_rows(rng.standard_normal((n_students, 512)))
+        student_ids = np.repeat(np.arange(n_students), PHOTOS_PER_STUDENT)
+        gallery = make_photos(centres, student_ids, rng)
+        queries = make_photos(centres, rng.choice(n_students, n_queries, replace=False), rng)
+
+    start = time.perf_counter()
+    index = IVFIndex().build(gallery, student_ids)
+    print(f"N={len(gallery)} ({'ngẫu nhiên' if unstructured else f'{PHOTOS_PER_STUDENT} ảnh/học sinh'}), "
+          f"nlist={index.nlist}, build={time.perf_counter() - start:.2f}s")
+
+    exact = []
+    start = time.perf_counter()
+    for q in queries:
+        exact.append(index.brute_force_search(q, k=10))
+    brute_ms = (time.perf_counter() - start) / n_queries * 1000
+    print(f"brute force: {brute_ms:.3f} ms/truy vấn")
+
+    print(f"{'nprobe':>6} {'recall@1':>9} {'recall@10':>10} {'match@10':>9} {'ms/truy vấn':>12}")
+    for nprobe in (4, 8, 16, 32, 64):
+        hits1 = hits10 = matched = matches = 0
+        start = time.perf_counter()
+        approx = [index.search(q, k=10, nprobe=nprobe)[1] for q in queries]
+        elapsed_ms = (time.perf_counter() - start) / n_queries * 1000
+        for a, (scores, e) in zip(approx, exact):
+            hits1 += int(len(a) > 0 and a[0] == e[0])
+            hits10 += len(np.intersect1d(a, e))
+            relevant = e[scores >= MATCH_SCORE]
+            matches += len(relevant)
+            matched += len(np.intersect1d(a, relevant))
+        match_recall = matched / matches if matches else float("nan")
+        marker = "  (mặc định)" if nprobe == index.nprobe else ""
+        print(f"{nprobe:>6} {hits1 / n_queries:>9.3f} {hits10 / (10 * n_queries):>10.3f} "
+              f"{match_recall:>9.3f} {elapsed_ms:>12.3f}{marker}")
+
+
+if __name__ == "__main__":
+    main()
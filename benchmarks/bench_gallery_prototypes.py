@@ -0,0 +1,65 @@
+"""
+Đo độ chính xác và độ trễ của ClassGallery khi mỗi học sinh có K embedding.
+
+Dữ liệu giả lập: mỗi học sinh có một "danh tính" 512 chiều; mỗi ảnh đăng ký
+và mỗi ảnh truy vấn là danh tính cộng nhiễu riêng (góc mặt, ánh sáng khác nhau).
+So sánh: chỉ ảnh mới nhất (K=1, như trước), max-over-K, và prototype trung bình.
+
+Chạy:
+    python benchmarks/bench_gallery_prototypes.py [số_học_sinh] [số_truy_vấn]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service.face_gallery import ClassGallery, normalize_rows
+
+NOISE = 2.0
+THRESHOLD = 0.3
+
+
+def photos(identities: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Một ảnh (embedding) cho mỗi danh tính"""
+    noise = normalize_rows(rng.standard_normal(identities.shape))
+    return normalize_rows(identities + NOISE * noise)
+
+
+def time_ms(func, queries) -> float:
+    start = time.perf_counter()
+    for q in queries:
+        func(q)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    n_students = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = np.random.default_rng(7)
+
+    identities = normalize_rows(rng.standard_normal((n_students, 512)))
+    enrolled = np.stack([photos(identities, rng) for _ in range(10)], axis=1)
+    targets = rng.choice(n_students, n_queries)
+    queries = photos(identities[targets], rng)
+    frames = queries[: (n_queries // 5) * 5].reshape(-1, 5, 512)
+    ids = [str(i) for i in range(n_students)]
+
+    print(f"S={n_students} học sinh, {n_queries} truy vấn")
+    print(f"{'K':>3} {'reduce':>6} {'top-1':>7} {'match ms':>9} {'match_many(5) ms':>17}")
+    for k in (1, 3, 5, 10):
+        for reduce in ("max", "mean") if k > 1 else ("max",):
+            gallery = ClassGallery(ids, ids, list(enrolled[:, :k]), reduce=reduce)
+            top1 = np.mean([
+                int(np.argmax(gallery.scores(q))) == t for q, t in zip(queries, targets)
+            ])
+            single_ms = time_ms(gallery.scores, queries)
+            many_ms = time_ms(lambda f: gallery.match_many(f, THRESHOLD), frames)
+            print(f"{k:>3} {reduce:>6} {top1:>7.3f} {single_ms:>9.3f} {many_ms:>17.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+So sánh thời gian mỗi lần gọi các truy vấn hay dùng khi chạy bằng text query
+và bằng server-side prepared statement (cache theo kết nối trong DatabaseConnection).
+
+Cần database MySQL đã có dữ liệu (xem database/create_database.py và example_database.py).
+
+Chạy:
+    python benchmarks/bench_prepared_statements.py [số_lần_gọi]
+"""
+
+import os
+import statistics
+import sys
+import time
+from datetime import date
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service import db, StudentsRepository, AttendanceRepository
+
+
+def measure(func, args, n_calls: int):
+    """Thời gian (ms) của từng lần gọi"""
+    func(*args)  # warm-up: mở kết nối và prepare statement
+    timings = []
+    for _ in range(n_calls):
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    if not db.connect():
+        sys.exit(1)
+
+    try:
+        sample = db.execute_query("""
+            SELECT student_id, class_id, DATE(timestamp) as day
+            FROM attendance
+            ORDER BY attendance_id DESC
+            LIMIT 1
+        """)
+        if sample:
+            student_id, class_id, day = sample[0]['student_id'], sample[0]['class_id'], sample[0]['day']
+        else:
+            student_id, class_id, day = 1, 1, date.today()
+
+        cases = [
+            ("get_student_by_id", StudentsRepository.get_student_by_id, (student_id,)),
+            ("get_attendance_by_class_and_date", AttendanceRepository.get_attendance_by_class_and_date, (class_id, day)),
+        ]
+        print(f"{n_calls} lần gọi / trường hợp")
+        print(f"{'truy vấn':<34} {'text ms':>9} {'prepared ms':>12} {'tiết kiệm':>10}")
+        for name, func, args in cases:
+            db.prepared_statements = False
+            text = statistics.median(measure(func, args, n_calls))
+            db.prepared_statements = True
+            prepared = statistics.median(measure(func, args, n_calls))
+            print(f"{name:<34} {text:>9.3f} {prepared:>12.3f} {(text - prepared) / text:>9.1%}")
+        print(db.stats())
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
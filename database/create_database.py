@@ -54,20 +54,30 @@ CREATE TABLE students (
     student_code VARCHAR(20) UNIQUE,
     class_id INT NOT NULL,
     avatar_url VARCHAR(255),
-    FOREIGN KEY (class_id) REFERENCES classes(class_id)
+    FOREIGN KEY (class_id) REFERENCES classes(class_id),
+    -- Phân trang keyset theo (full_name, student_id)
+    INDEX idx_students_name (full_name)
 );
 
 -- ===========================================================
 -- 4. Bảng lưu vector embedding từ InsightFace
 -- ===========================================================
 
+-- Vector lưu dạng nhị phân (float32 hoặc float16, little-endian),
+-- đọc bằng np.frombuffer thay vì json.loads
+
 CREATE TABLE face_embeddings (
     embedding_id INT PRIMARY KEY AUTO_INCREMENT,
     student_id INT NOT NULL,
-    embedding_json LONGTEXT NOT NULL,
+    embedding_vector BLOB NOT NULL,
+    embedding_dtype ENUM('float32','float16') NOT NULL DEFAULT 'float32',
     image_url VARCHAR(255),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (student_id) REFERENCES students(student_id)
+    FOREIGN KEY (student_id) REFERENCES students(student_id),
+    -- Phân trang keyset theo (created_at, embedding_id)
+    INDEX idx_embeddings_created (created_at),
+    -- Embedding mới nhất / tất cả embedding của một học sinh
+    INDEX idx_embeddings_student (student_id, embedding_id)
 );
 
 -- ===========================================================
@@ -95,12 +105,51 @@ CREATE TABLE attendance (
     method ENUM('face_recognition','manual') DEFAULT 'face_recognition',
     camera_id INT,
     note VARCHAR(255),
+    attendance_date DATE AS (DATE(timestamp)) STORED,
+    -- Ngày của bản ghi tự động, NULL với điểm danh thủ công để khóa UNIQUE bỏ qua
+    recognition_date DATE AS (IF(method = 'manual', NULL, DATE(timestamp))) STORED,
 
     FOREIGN KEY (student_id) REFERENCES students(student_id),
     FOREIGN KEY (class_id) REFERENCES classes(class_id),
     FOREIGN KEY (camera_id) REFERENCES cameras(camera_id),
 
-    INDEX idx_attendance_student_date (student_id, timestamp)
+    INDEX idx_attendance_student_date (student_id, timestamp),
+    -- Phân trang keyset theo (timestamp, attendance_id)
+    INDEX idx_attendance_timestamp (timestamp),
+    -- Điểm danh theo lớp trong khoảng thời gian, có status để thống kê chỉ đọc index
+    INDEX idx_attendance_class_time (class_id, timestamp, status),
+    INDEX idx_attendance_status (status, timestamp),
+    INDEX idx_attendance_session (session, timestamp),
+    -- Tính lại bảng tổng hợp theo (học sinh, lớp, ngày)
+    INDEX idx_attendance_day (student_id, class_id, attendance_date),
+    -- Mỗi học sinh chỉ có một bản ghi tự động cho mỗi lớp/ngày/ca
+    -- (giáo viên vẫn điểm danh thủ công được, giống index Mongo trong main.py)
+    UNIQUE KEY uq_attendance_session (student_id, class_id, recognition_date, session)
+);
+
+-- ===========================================================
+-- 7. Bảng tổng hợp điểm danh theo ngày
+-- ===========================================================
+
+-- Cập nhật cùng transaction với mỗi lần ghi/sửa/xóa điểm danh
+-- (AttendanceRepository), các hàm thống kê đọc bảng này thay vì quét attendance.
+-- camera_id = 0: điểm danh không qua camera (thủ công)
+
+CREATE TABLE attendance_daily_summary (
+    attendance_date DATE NOT NULL,
+    class_id INT NOT NULL,
+    student_id INT NOT NULL,
+    camera_id INT NOT NULL DEFAULT 0,
+    total_records INT NOT NULL DEFAULT 0,
+    present_count INT NOT NULL DEFAULT 0,
+    absent_count INT NOT NULL DEFAULT 0,
+    late_count INT NOT NULL DEFAULT 0,
+    excused_count INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (student_id, class_id, attendance_date, camera_id),
+    INDEX idx_summary_class (class_id, attendance_date),
+    INDEX idx_summary_camera (camera_id, attendance_date),
+    INDEX idx_summary_date (attendance_date)
 );
 """
 
@@ -76,16 +76,21 @@ def create_sample_data():
             ("Hoàng Văn Em", "HS005", class2_id, date(2008, 11, 5), "male"),
         ]
         
-        student_ids = []
-        for name, code, cid, dob, gender in students_data:
-            student_id = StudentsRepository.create_student(
-                full_name=name,
-                student_code=code,
-                class_id=cid,
-                date_of_birth=dob,
-                gender=gender
-            )
-            student_ids.append(student_id)
+        # Một transaction cho cả danh sách thay vì một commit mỗi học sinh
+        student_ids = StudentsRepository.create_student_many([
+            {
+                "full_name": name,
+                "student_code": code,
+                "class_id": cid,
+                "date_of_birth": dob,
+                "gender": gender
+            }
+            for name, code, cid, dob, gender in students_data
+        ])
+        if len(student_ids) != len(students_data):
+            print("   ✗ Không tạo được học sinh")
+            return False
+        for student_id, (name, code, _, _, _) in zip(student_ids, students_data):
             print(f"   ✓ Đã tạo học sinh ID: {student_id} - {name} ({code})")
         
         # ===========================================================
@@ -94,15 +99,16 @@ def create_sample_data():
         print("\n4. Tạo face embeddings mẫu...")
         import random
         
-        for student_id in student_ids:
-            # Tạo embedding giả (512 chiều như InsightFace)
-            fake_embedding = [random.random() for _ in range(512)]
-            
-            embedding_id = FaceEmbeddingsRepository.create_embedding(
-                student_id=student_id,
-                embedding=fake_embedding,
-                image_url=f"data/images/student_{student_id}.jpg"
-            )
+        # Tạo embedding giả (512 chiều như InsightFace)
+        embedding_ids = FaceEmbeddingsRepository.create_embedding_many([
+            {
+                "student_id": student_id,
+                "embedding": [random.random() for _ in range(512)],
+                "image_url": f"data/images/student_{student_id}.jpg"
+            }
+            for student_id in student_ids
+        ])
+        for embedding_id, student_id in zip(embedding_ids, student_ids):
             print(f"   ✓ Đã tạo embedding ID: {embedding_id} cho học sinh ID: {student_id}")
         
         # ===========================================================
@@ -130,42 +136,45 @@ def create_sample_data():
         today = datetime.now()
         yesterday = today - timedelta(days=1)
         
+        attendance_records = []
+        
         # Điểm danh hôm qua
         for student_id in student_ids[:3]:  # 3 học sinh đầu
-            AttendanceRepository.create_attendance(
-                student_id=student_id,
-                class_id=class1_id,
-                session="morning",
-                status="present",
-                method="face_recognition",
-                camera_id=camera1_id,
-                timestamp=yesterday.replace(hour=7, minute=30)
-            )
+            attendance_records.append({
+                "student_id": student_id,
+                "class_id": class1_id,
+                "session": "morning",
+                "status": "present",
+                "method": "face_recognition",
+                "camera_id": camera1_id,
+                "timestamp": yesterday.replace(hour=7, minute=30)
+            })
         
         # Điểm danh hôm nay
         for student_id in student_ids[:2]:  # 2 học sinh đầu
-            AttendanceRepository.create_attendance(
-                student_id=student_id,
-                class_id=class1_id,
-                session="morning",
-                status="present",
-                method="face_recognition",
-                camera_id=camera1_id,
-                timestamp=today.replace(hour=7, minute=25)
-            )
+            attendance_records.append({
+                "student_id": student_id,
+                "class_id": class1_id,
+                "session": "morning",
+                "status": "present",
+                "method": "face_recognition",
+                "camera_id": camera1_id,
+                "timestamp": today.replace(hour=7, minute=25)
+            })
         
         # Một học sinh đến muộn
-        AttendanceRepository.create_attendance(
-            student_id=student_ids[2],
-            class_id=class1_id,
-            session="morning",
-            status="late",
-            method="manual",
-            note="Đến muộn 15 phút",
-            timestamp=today.replace(hour=7, minute=45)
-        )
-        
-        print(f"   ✓ Đã tạo {len(student_ids[:3]) + len(student_ids[:2]) + 1} bản ghi điểm danh")
+        attendance_records.append({
+            "student_id": student_ids[2],
+            "class_id": class1_id,
+            "session": "morning",
+            "status": "late",
+            "method": "manual",
+            "note": "Đến muộn 15 phút",
+            "timestamp": today.replace(hour=7, minute=45)
+        })
+        
+        attendance_ids = AttendanceRepository.create_attendance_many(attendance_records)
+        print(f"   ✓ Đã tạo {len(attendance_ids)} bản ghi điểm danh")
         
         # ===========================================================
         # Hiển thị thống kê
@@ -0,0 +1,409 @@
+"""
+Script migration cho database đã tạo bằng phiên bản cũ của create_database.py
+
+Cách dùng:
+    python database/migrate.py --list
+    python database/migrate.py embeddings_binary [--batch-size 500] [--dtype float32|float16] [--drop-json]
+    python database/migrate.py attendance_unique [--dedupe]
+    python database/migrate.py pagination_indexes
+    python database/migrate.py attendance_indexes
+    python database/migrate.py attendance_summary [--days 31]
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import timedelta
+from dotenv import load_dotenv
+
+# Load biến môi trường từ file .env
+load_dotenv()
+
+# Thêm thư mục gốc của project vào path để tìm module service
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service import db, AttendanceRepository
+from service.face_embeddings import encode_embedding
+
+
+def column_exists(table: str, column: str) -> bool:
+    """Kiểm tra cột đã tồn tại trong bảng chưa"""
+    query = """
+        SELECT COUNT(*) as total
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """
+    results = db.execute_query(query, (table, column))
+    return bool(results and results[0]['total'])
+
+
+def index_exists(table: str, index: str) -> bool:
+    """Kiểm tra index đã tồn tại trong bảng chưa"""
+    query = """
+        SELECT COUNT(*) as total
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """
+    results = db.execute_query(query, (table, index))
+    return bool(results and results[0]['total'])
+
+
+# ===========================================================
+# embeddings_binary: LONGTEXT JSON -> BLOB float32/float16
+# ===========================================================
+
+def column_nullable(table: str, column: str) -> bool:
+    """Kiểm tra cột có cho phép NULL không"""
+    query = """
+        SELECT IS_NULLABLE as nullable
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """
+    results = db.execute_query(query, (table, column))
+    return bool(results and results[0]['nullable'] == 'YES')
+
+
+def migrate_embeddings_binary(args):
+    """Chuyển face_embeddings.embedding_json sang cột nhị phân embedding_vector theo từng lô"""
+    print("\n1. Thêm cột embedding_vector / embedding_dtype...")
+    if not column_exists('face_embeddings', 'embedding_vector'):
+        db.execute_update("""
+            ALTER TABLE face_embeddings
+            ADD COLUMN embedding_vector BLOB NULL AFTER student_id,
+            ADD COLUMN embedding_dtype ENUM('float32','float16') NOT NULL DEFAULT 'float32' AFTER embedding_vector
+        """)
+        if not column_exists('face_embeddings', 'embedding_vector'):
+            print("   ✗ Không thêm được cột")
+            return False
+        print("   ✓ Đã thêm cột")
+    else:
+        print("   ⚠ Bỏ qua (đã tồn tại)")
+
+    if not column_exists('face_embeddings', 'embedding_json'):
+        print("\n✓ Không còn cột embedding_json, không có gì để chuyển đổi")
+        return True
+
+    # Code mới không ghi embedding_json nữa nên cột cũ phải cho phép NULL
+    db.execute_update("ALTER TABLE face_embeddings MODIFY embedding_json LONGTEXT NULL")
+    if not column_nullable('face_embeddings', 'embedding_json'):
+        print("   ✗ Không đổi được embedding_json sang NULL")
+        return False
+
+    print(f"\n2. Chuyển đổi dữ liệu (lô {args.batch_size} dòng, {args.dtype})...")
+    select_query = """
+        SELECT embedding_id, embedding_json
+        FROM face_embeddings
+        WHERE embedding_vector IS NULL AND embedding_id > %s
+        ORDER BY embedding_id
+        LIMIT %s
+    """
+    update_query = """
+        UPDATE face_embeddings
+        SET embedding_vector = %s, embedding_dtype = %s
+        WHERE embedding_id = %s
+    """
+    last_id = 0
+    converted = 0
+    failed = []
+    while True:
+        # execute_query trả [] cả khi lỗi: số dòng còn thiếu được kiểm tra lại ở bước 3
+        rows = db.execute_query(select_query, (last_id, args.batch_size))
+        if not rows:
+            break
+        params_list = []
+        for row in rows:
+            try:
+                blob = encode_embedding(json.loads(row['embedding_json']), args.dtype)
+                params_list.append((blob, args.dtype, row['embedding_id']))
+            except (TypeError, ValueError):
+                failed.append(row['embedding_id'])
+        if params_list:
+            affected_rows, _ = db.execute_many(update_query, params_list)
+            if affected_rows != len(params_list):
+                print(f"   ✗ Lỗi ghi lô sau embedding_id {last_id}: {affected_rows}/{len(params_list)} dòng")
+                return False
+        converted += len(params_list)
+        last_id = rows[-1]['embedding_id']
+        print(f"   ✓ Đã chuyển {converted} dòng (đến embedding_id {last_id})")
+
+    if failed:
+        print(f"   ✗ {len(failed)} dòng có JSON lỗi, giữ nguyên: {failed[:20]}")
+        return False
+
+    print("\n3. Kiểm tra dữ liệu đã chuyển...")
+    remaining = db.execute_query("SELECT COUNT(*) as total FROM face_embeddings WHERE embedding_vector IS NULL")
+    if not remaining:
+        print("   ✗ Không kiểm tra được")
+        return False
+    if remaining[0]['total']:
+        print(f"   ✗ Còn {remaining[0]['total']} dòng chưa có embedding_vector")
+        return False
+    print("   ✓ Mọi dòng đã có embedding_vector")
+
+    if args.drop_json:
+        print("\n4. Xóa cột embedding_json...")
+        db.execute_update("""
+            ALTER TABLE face_embeddings
+            MODIFY embedding_vector BLOB NOT NULL,
+            DROP COLUMN embedding_json
+        """)
+        if column_exists('face_embeddings', 'embedding_json'):
+            print("   ✗ Không xóa được cột embedding_json")
+            return False
+        print("   ✓ Đã xóa cột embedding_json")
+
+    print(f"\n✓ Hoàn tất: {converted} embeddings đã chuyển sang dạng nhị phân")
+    return True
+
+
+# ===========================================================
+# attendance_unique: một bản ghi / học sinh / lớp / ngày / ca
+# ===========================================================
+
+def index_columns(table: str, index: str) -> list:
+    """Danh sách cột của index theo thứ tự"""
+    query = """
+        SELECT COLUMN_NAME as column_name
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        ORDER BY SEQ_IN_INDEX
+    """
+    return [row['column_name'] for row in db.execute_query(query, (table, index))]
+
+
+def add_generated_column(table: str, column: str, definition: str) -> bool:
+    """Thêm cột sinh tự động nếu chưa có, trả về False nếu ALTER lỗi"""
+    if column_exists(table, column):
+        print(f"   ⚠ Bỏ qua {table}.{column} (đã tồn tại)")
+        return True
+    db.execute_update(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    if not column_exists(table, column):
+        print(f"   ✗ Không thêm được {table}.{column}")
+        return False
+    print(f"   ✓ Đã thêm {table}.{column}")
+    return True
+
+
+UNIQUE_COLUMNS = ['student_id', 'class_id', 'recognition_date', 'session']
+
+
+def migrate_attendance_unique(args):
+    """Thêm khóa UNIQUE chặn điểm danh tự động trùng trong cùng ca (không áp dụng cho điểm danh thủ công)"""
+    print("\n1. Thêm cột attendance_date / recognition_date...")
+    if not add_generated_column('attendance', 'attendance_date', "DATE AS (DATE(timestamp)) STORED"):
+        return False
+    if not add_generated_column(
+        'attendance', 'recognition_date', "DATE AS (IF(method = 'manual', NULL, DATE(timestamp))) STORED"
+    ):
+        return False
+    if not add_indexes([('attendance', 'idx_attendance_day', '(student_id, class_id, attendance_date)')]):
+        return False
+
+    existing = index_columns('attendance', 'uq_attendance_session')
+    if existing == UNIQUE_COLUMNS:
+        print("\n✓ Khóa uq_attendance_session đã tồn tại")
+        return True
+
+    # Chỉ bản ghi tự động (recognition_date khác NULL) bị coi là trùng;
+    # điểm danh thủ công không bao giờ bị xóa
+    print("\n2. Kiểm tra bản ghi tự động trùng...")
+    duplicates = db.execute_query("""
+        SELECT COUNT(*) as total
+        FROM attendance a1
+        JOIN attendance a2
+          ON a1.student_id = a2.student_id
+         AND a1.class_id = a2.class_id
+         AND a1.recognition_date = a2.recognition_date
+         AND a1.session = a2.session
+         AND a1.attendance_id > a2.attendance_id
+    """)
+    if not duplicates:
+        print("   ✗ Không kiểm tra được bản ghi trùng")
+        return False
+    total = duplicates[0]['total']
+    if total:
+        if not args.dedupe:
+            print(f"   ✗ Có {total} bản ghi tự động trùng. Chạy lại với --dedupe để xóa (giữ bản ghi sớm nhất)")
+            return False
+        affected_rows, _ = db.execute_update("""
+            DELETE a1 FROM attendance a1
+            JOIN attendance a2
+              ON a1.student_id = a2.student_id
+             AND a1.class_id = a2.class_id
+             AND a1.recognition_date = a2.recognition_date
+             AND a1.session = a2.session
+             AND a1.attendance_id > a2.attendance_id
+        """)
+        print(f"   ✓ Đã xóa {affected_rows} bản ghi tự động trùng")
+    else:
+        print("   ✓ Không có bản ghi trùng")
+
+    print("\n3. Thêm khóa UNIQUE...")
+    # Khóa cũ (student_id, class_id, attendance_date, session) áp dụng cả cho điểm danh thủ công
+    drop = "DROP INDEX uq_attendance_session, " if existing else ""
+    db.execute_update(f"""
+        ALTER TABLE attendance
+        {drop}ADD UNIQUE KEY uq_attendance_session (student_id, class_id, recognition_date, session)
+    """)
+    if index_columns('attendance', 'uq_attendance_session') != UNIQUE_COLUMNS:
+        print("   ✗ Không thêm được uq_attendance_session")
+        return False
+    print("   ✓ Đã thêm uq_attendance_session")
+    return True
+
+
+# ===========================================================
+# pagination_indexes: index cho phân trang keyset
+# ===========================================================
+
+PAGINATION_INDEXES = [
+    ('students', 'idx_students_name', '(full_name)'),
+    ('face_embeddings', 'idx_embeddings_created', '(created_at)'),
+    ('attendance', 'idx_attendance_timestamp', '(timestamp)'),
+]
+
+
+def add_indexes(indexes) -> bool:
+    """Thêm các index (bảng, tên, cột) còn thiếu"""
+    ok = True
+    for table, index, columns in indexes:
+        if index_exists(table, index):
+            print(f"   ⚠ Bỏ qua {table}.{index} (đã tồn tại)")
+            continue
+        db.execute_update(f"ALTER TABLE {table} ADD INDEX {index} {columns}")
+        if index_exists(table, index):
+            print(f"   ✓ Đã thêm {table}.{index}")
+        else:
+            print(f"   ✗ Không thêm được {table}.{index}")
+            ok = False
+    return ok
+
+
+def migrate_pagination_indexes(args):
+    """Thêm index theo khóa sắp xếp của các endpoint phân trang"""
+    return add_indexes(PAGINATION_INDEXES)
+
+
+# ===========================================================
+# attendance_indexes: index cho lọc theo lớp/ngày, trạng thái, ca
+# ===========================================================
+
+ATTENDANCE_INDEXES = [
+    ('attendance', 'idx_attendance_class_time', '(class_id, timestamp, status)'),
+    ('attendance', 'idx_attendance_status', '(status, timestamp)'),
+    ('attendance', 'idx_attendance_session', '(session, timestamp)'),
+    ('face_embeddings', 'idx_embeddings_student', '(student_id, embedding_id)'),
+]
+
+
+def migrate_attendance_indexes(args):
+    """Thêm index cho truy vấn điểm danh theo lớp/khoảng ngày, trạng thái, ca và embedding theo học sinh"""
+    ok = add_indexes(ATTENDANCE_INDEXES)
+    if ok:
+        for table in ('attendance', 'face_embeddings'):
+            db.execute_query(f"ANALYZE TABLE {table}")
+        print("   ✓ Đã cập nhật thống kê index (ANALYZE TABLE)")
+    return ok
+
+
+# ===========================================================
+# attendance_summary: bảng tổng hợp điểm danh theo ngày
+# ===========================================================
+
+def migrate_attendance_summary(args):
+    """Tạo bảng attendance_daily_summary và tính lại từ lịch sử điểm danh theo từng khoảng ngày"""
+    if not column_exists('attendance', 'attendance_date') or not index_exists('attendance', 'idx_attendance_day'):
+        print("✗ Chưa có cột attendance.attendance_date / idx_attendance_day, chạy migration attendance_unique trước")
+        return False
+
+    print("\n1. Tạo bảng attendance_daily_summary...")
+    db.execute_update("""
+        CREATE TABLE IF NOT EXISTS attendance_daily_summary (
+            attendance_date DATE NOT NULL,
+            class_id INT NOT NULL,
+            student_id INT NOT NULL,
+            camera_id INT NOT NULL DEFAULT 0,
+            total_records INT NOT NULL DEFAULT 0,
+            present_count INT NOT NULL DEFAULT 0,
+            absent_count INT NOT NULL DEFAULT 0,
+            late_count INT NOT NULL DEFAULT 0,
+            excused_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, class_id, attendance_date, camera_id),
+            INDEX idx_summary_class (class_id, attendance_date),
+            INDEX idx_summary_camera (camera_id, attendance_date),
+            INDEX idx_summary_date (attendance_date)
+        )
+    """)
+    if not index_exists('attendance_daily_summary', 'PRIMARY'):
+        print("   ✗ Không tạo được bảng")
+        return False
+    print("   ✓ Đã có bảng")
+
+    bounds = db.execute_query("SELECT MIN(attendance_date) as first_day, MAX(attendance_date) as last_day FROM attendance")
+    if not bounds or bounds[0]['first_day'] is None:
+        print("\n✓ Chưa có dữ liệu điểm danh, không có gì để tổng hợp")
+        return True
+    first_day, last_day = bounds[0]['first_day'], bounds[0]['last_day']
+
+    print(f"\n2. Tổng hợp {first_day} → {last_day} (mỗi lần {args.days} ngày)...")
+    total = 0
+    start = first_day
+    while start <= last_day:
+        end = min(start + timedelta(days=args.days - 1), last_day)
+        rows = AttendanceRepository.rebuild_daily_summary(start, end)
+        if rows < 0:
+            print(f"   ✗ Lỗi khi tổng hợp {start} → {end}")
+            return False
+        total += rows
+        print(f"   {start} → {end}: {rows} dòng")
+        start = end + timedelta(days=1)
+
+    print(f"\n✓ Hoàn tất: {total} dòng tổng hợp")
+    return True
+
+
+MIGRATIONS = {
+    'embeddings_binary': migrate_embeddings_binary,
+    'attendance_unique': migrate_attendance_unique,
+    'pagination_indexes': migrate_pagination_indexes,
+    'attendance_indexes': migrate_attendance_indexes,
+    'attendance_summary': migrate_attendance_summary,
+}
+
+
+def main():
+    """Hàm chính"""
+    parser = argparse.ArgumentParser(description="Migration cho database ai_attendance")
+    parser.add_argument('migration', nargs='?', choices=sorted(MIGRATIONS))
+    parser.add_argument('--list', action='store_true', help="Liệt kê các migration")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--drop-json', action='store_true', help="Xóa cột embedding_json sau khi chuyển đổi")
+    parser.add_argument('--dedupe', action='store_true', help="Xóa điểm danh tự động trùng trước khi thêm khóa UNIQUE")
+    parser.add_argument('--days', type=int, default=31, help="Số ngày mỗi lần tổng hợp lại attendance_daily_summary")
+    args = parser.parse_args()
+
+    if args.list or not args.migration:
+        for name, func in MIGRATIONS.items():
+            print(f"{name:20} {func.__doc__}")
+        return
+
+    print("=" * 60)
+    print(f"MIGRATION: {args.migration}")
+    print("=" * 60)
+
+    if not db.connect():
+        print("✗ Không thể kết nối database!")
+        sys.exit(1)
+
+    try:
+        if not MIGRATIONS[args.migration](args):
+            sys.exit(1)
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ const DataViewer = ({ tableName, onClose }) => {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
   const [selectedItem, setSelectedItem] = useState(null)
+  const [nextCursor, setNextCursor] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   const endpoints = {
     teachers: '/api/teachers',
@@ -21,13 +23,23 @@ const DataViewer = ({ tableName, onClose }) => {
     fetchData()
   }, [tableName])
 
+  // Endpoint phân trang trả về { items, next_cursor }, các endpoint khác trả về mảng
+  const fetchPage = async (cursor) => {
+    const endpoint = endpoints[tableName]
+    const response = await axios.get(endpoint, { params: cursor ? { cursor } : {} })
+    if (Array.isArray(response.data)) {
+      return { items: response.data, next_cursor: null }
+    }
+    return response.data
+  }
+
   const fetchData = async () => {
     setLoading(true)
     setError(null)
     try {
-      const endpoint = endpoints[tableName]
-      const response = await axios.get(endpoint)
-      setData(response.data)
+      const page = await fetchPage(null)
+      setData(page.items)
+      setNextCursor(page.next_cursor)
     } catch (err) {
       setError(err.message)
       console.error('Error fetching data:', err)
@@ -36,6 +48,20 @@ const DataViewer = ({ tableName, onClose }) => {
     }
   }
 
+  const fetchMore = async () => {
+    setLoadingMore(true)
+    try {
+      const page = await fetchPage(nextCursor)
+      setData((rows) => [...rows, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (err) {
+      setError(err.message)
+      console.error('Error fetching data:', err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const formatValue = (value) => {
     if (value === null || value === undefined) return '-'
     if (typeof value === 'boolean') return value ? 'Có' : 'Không'
@@ -84,7 +110,9 @@ const DataViewer = ({ tableName, onClose }) => {
           {tableName === 'attendance' && '✅ Điểm danh'}
         </h2>
         <div className="header-actions">
-          <span className="count">Tổng: {data.length} bản ghi</span>
+          <span className="count">
+            {nextCursor ? `Đã tải: ${data.length} bản ghi` : `Tổng: ${data.length} bản ghi`}
+          </span>
           <button onClick={fetchData} className="refresh-btn">🔄 Làm mới</button>
           <button onClick={onClose} className="close-btn">✕ Đóng</button>
         </div>
@@ -125,6 +153,11 @@ const DataViewer = ({ tableName, onClose }) => {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <button onClick={fetchMore} className="refresh-btn load-more-btn" disabled={loadingMore}>
+              {loadingMore ? 'Đang tải...' : 'Tải thêm'}
+            </button>
+          )}
         </div>
       )}
 
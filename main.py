@@ -1,51 +1,292 @@
 from fastapi import FastAPI, UploadFile, File, Form
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from app.db import db
 from app.models import Teacher, Class, Student, Attendance
 import os, io, asyncio
-from PIL import Image
+import csv, json, shutil, tempfile, zipfile, zlib
 import numpy as np
 from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-import insightface
-import cv2
+from service.face_gallery import FaceGallery
+from service.attendance_writer import AttendanceWriter, AttendanceDeduplicator, session_of
+from service.inference_pool import FaceModelPool
+from service.image_decode import decode_image_bgr
+from service.embedding_cache import EmbeddingCache
+from service.camera_worker import CameraStreamWorker, camera_source
+from service.face_tracker import FaceTracker
+from service.cameras import CamerasRepository
+from service.async_db import run_db
+from service import async_db, metrics
 
 app = FastAPI()
 IMAGE_DIR = "data/images"
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
-executor = ThreadPoolExecutor(max_workers=4)
+MATCH_THRESHOLD = 0.7  # ngưỡng 70%
+
+
+async def insert_attendance_batch(records):
+    """Ghi một lô điểm danh; bản ghi trùng (bị unique index chặn) được bỏ qua"""
+    try:
+        await db.attendance.insert_many(records, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+
+# Mỗi sinh viên chỉ được ghi một lần cho mỗi lớp/ngày/ca
+deduplicator = AttendanceDeduplicator(
+    maxsize=int(os.getenv("ATTENDANCE_DEDUP_SIZE", "50000"))
+)
+
+
+def forget_dropped_attendance(records):
+    """Bản ghi bị bỏ khi hàng đợi đầy: cho phép lần nhận diện sau ghi lại"""
+    for doc in records:
+        deduplicator.forget(doc["student_id"], doc["class_id"], doc["day"], doc["session"])
+
+
+# Ghi điểm danh nhận diện theo lô, không nằm trên đường đi của request
+attendance_writer = AttendanceWriter(
+    insert_attendance_batch,
+    max_batch_size=int(os.getenv("ATTENDANCE_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("ATTENDANCE_FLUSH_INTERVAL", "1.0")),
+    max_pending=int(os.getenv("ATTENDANCE_MAX_PENDING", "10000")),
+    on_drop=forget_dropped_attendance
+)
+
+
+def record_attendance(class_id: str, student_id: str, camera_id: str = None) -> bool:
+    """Đưa điểm danh tự động vào hàng đợi ghi, trừ khi đã ghi trong ca này"""
+    now = datetime.now()
+    if not deduplicator.should_record(student_id, class_id, now):
+        return False
+    doc = {
+        "class_id": class_id,
+        "student_id": student_id,  # vẫn lưu trong DB để quản lý
+        "time": datetime.utcnow(),
+        "status": "present",
+        "day": now.date().isoformat(),
+        "session": session_of(now)
+    }
+    if camera_id is not None:
+        doc["camera_id"] = camera_id
+    return attendance_writer.submit(doc)
+
 
 # ----------------------
 # Load InsightFace model
 # ----------------------
-face_model = insightface.app.FaceAnalysis(name="buffalo_l")  # model lớn
-face_model.prepare(ctx_id=-1, det_size=(640, 640))           # CPU
+# Pool nhiều phiên bản model; mặc định chia theo số core của máy.
+# Model được nạp ở nền khi khởi động (xem startup_event), không nạp lúc import.
+# FACE_MODEL_NAME: buffalo_l (model lớn, mặc định), buffalo_m, buffalo_s, buffalo_sc (nhẹ hơn)
+FACE_DET_SIZE = int(os.getenv("FACE_DET_SIZE", "640"))
+face_pool = FaceModelPool(
+    size=int(os.getenv("FACE_POOL_SIZE", "0")) or None,
+    model_name=os.getenv("FACE_MODEL_NAME", "buffalo_l"),
+    det_size=(FACE_DET_SIZE, FACE_DET_SIZE),
+    ctx_id=-1,                                                 # CPU
+    intra_op_threads=int(os.getenv("FACE_INTRA_OP_THREADS", "0")) or None
+)
+
+MODEL_NOT_READY = {"ok": False, "msg": "Mô hình nhận diện đang được nạp, vui lòng thử lại sau"}
+
+# Cạnh dài tối thiểu khi giải mã ảnh upload (mặc định theo det_size của model)
+DECODE_MIN_SIDE = int(os.getenv("DECODE_MIN_SIDE", "0")) or None
+
+# Cache embedding theo hash nội dung ảnh: ảnh gửi lại (retry) trả kết quả ngay
+embedding_cache = EmbeddingCache(
+    maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL", "300")),
+    near_duplicates=os.getenv("EMBEDDING_CACHE_PHASH", "0") == "1"
+)
+
+
+# ----------------------
+# Khởi động / trạng thái
+# ----------------------
+@app.on_event("startup")
+async def startup_event():
+    """Khởi động tác vụ ghi điểm danh và nạp model ở nền"""
+    # Chặn trùng ở tầng DB: chỉ áp dụng cho bản ghi tự động (có day/session)
+    await db.attendance.create_index(
+        [("student_id", ASCENDING), ("class_id", ASCENDING), ("day", ASCENDING), ("session", ASCENDING)],
+        name="uq_attendance_session",
+        unique=True,
+        partialFilterExpression={"session": {"$exists": True}}
+    )
+    await attendance_writer.start()
+    # Không await: các endpoint CRUD phục vụ ngay trong lúc model đang nạp
+    asyncio.get_running_loop().run_in_executor(None, face_pool.load)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Ghi nốt điểm danh còn trong hàng đợi trước khi tắt"""
+    for worker in stream_workers.values():
+        worker.stop()
+    await attendance_writer.stop()
+    face_pool.shutdown()
+
+
+@app.get("/ready")
+async def readiness():
+    """Readiness: 200 khi nhận diện đã sẵn sàng, 503 khi model còn đang nạp"""
+    stats = face_pool.stats()
+    return JSONResponse(stats, status_code=200 if stats["ready"] else 503)
+
+
+@app.get("/inference/stats")
+async def inference_stats():
+    """Trạng thái pool model: số model, số đang bận, độ dài hàng đợi"""
+    stats = face_pool.stats()
+    stats["attendance_pending"] = attendance_writer.pending
+    stats["attendance_dropped"] = attendance_writer.dropped
+    stats["attendance_dedup"] = deduplicator.stats()
+    stats["embedding_cache"] = embedding_cache.stats()
+    return stats
+
+
+metrics.install_http_metrics(app, "recognition")
+async_db.register_metrics()
+metrics.REGISTRY.gauge(
+    "face_pool_models", "Model InsightFace trong pool theo trạng thái", ("state",),
+    callback=lambda: {("size",): face_pool.stats()["size"], ("busy",): face_pool.stats()["busy"]}
+)
+metrics.REGISTRY.gauge(
+    "face_pool_queue_depth", "Số request đang chờ model rảnh",
+    callback=lambda: face_pool.stats()["queue_depth"]
+)
+metrics.REGISTRY.gauge(
+    "attendance_pending", "Số bản ghi điểm danh đang chờ ghi theo lô",
+    callback=lambda: attendance_writer.pending
+)
+metrics.REGISTRY.gauge(
+    "attendance_dropped_records", "Số bản ghi điểm danh bị bỏ vì hàng đợi đầy",
+    callback=lambda: attendance_writer.dropped
+)
+metrics.REGISTRY.gauge(
+    "embedding_cache_entries", "Số embedding ảnh upload đang được cache",
+    callback=lambda: embedding_cache.stats()["size"]
+)
+metrics.REGISTRY.gauge(
+    "embedding_cache_hit_rate", "Tỉ lệ trúng cache embedding ảnh upload",
+    callback=lambda: embedding_cache.stats()["hit_rate"]
+)
+metrics.REGISTRY.gauge(
+    "camera_streams_running", "Số luồng camera đang chạy",
+    callback=lambda: sum(worker.running for worker in stream_workers.values())
+)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics dạng Prometheus: HTTP request, pool model, hàng đợi điểm danh, pool MySQL"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 # ----------------------
 # Utils
 # ----------------------
-def compute_embedding_insightface(img_bytes):
-    """Chuyển ảnh bytes sang embedding InsightFace."""
+async def embed_upload(content: bytes, near_scope: str = None):
+    """Embedding mọi khuôn mặt của ảnh upload, qua cache theo hash nội dung ảnh.
+
+    Lỗi khi tính (model, ảnh hỏng giữa chừng) trả về None nhưng không được cache.
+    Mặc định chỉ dùng kết quả của đúng ảnh này: ảnh gần giống theo dHash có thể là ảnh
+    của người khác (cùng kiosk, cùng khung hình). near_scope cho phép khớp gần đúng
+    với ảnh đã gửi trước đó trong cùng phạm vi, vd. ảnh mặt của cùng một học sinh.
+    """
     try:
-        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        img_np = np.array(img)
+        return await embedding_cache.get_or_compute(
+            content,
+            lambda: face_pool.run(compute_embeddings_insightface, content),
+            near_scope=near_scope
+        )
+    except Exception as e:
+        print("Lỗi compute_embeddings_insightface:", e)
+        return None
 
-        # Chuyển RGB sang BGR vì InsightFace dùng OpenCV
-        img_bgr = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
 
-        faces = face_model.get(img_bgr)
-        if not faces:
-            print("Không tìm thấy mặt")
-            return None
+def compute_embeddings_insightface(face_model, img_bytes):
+    """Chuyển ảnh bytes sang embedding của TẤT CẢ khuôn mặt trong ảnh (ma trận faces x 512).
 
-        return faces[0].embedding.tolist()
+    None khi ảnh không giải mã được hoặc không có mặt; lỗi khác được ném ra để không bị cache.
+    """
+    # Giải mã thẳng sang BGR (InsightFace dùng OpenCV), thu nhỏ ảnh lớn về cỡ det_size
+    img_bgr = decode_image_bgr(img_bytes, min_side=DECODE_MIN_SIDE or max(face_model.det_size))
+    if img_bgr is None:
+        return None
+    return embed_faces_bgr(face_model, img_bgr)
 
-    except Exception as e:
-        print("Lỗi compute_embedding_insightface:", e)
+
+def embed_faces_bgr(face_model, img_bgr):
+    """Embedding của tất cả khuôn mặt trong một khung hình BGR đã giải mã (ảnh upload hoặc camera)."""
+    faces = face_model.get(img_bgr)
+    if not faces:
+        print("Không tìm thấy mặt")
         return None
 
+    return np.stack([face.embedding for face in faces])
+
+
+def track_and_embed_bgr(face_model, tracker, img_bgr):
+    """Chỉ chạy detection cho mọi khung; embedding (theo lô) chỉ cho các track cần nhận diện.
+
+    Trả về danh sách (track, embedding) cần đối chiếu gallery.
+    """
+    from insightface.utils import face_align
+
+    bboxes, kpss = face_model.det_model.detect(img_bgr, max_num=0, metric="default")
+    if bboxes is None or len(bboxes) == 0:
+        tracker.update(np.empty((0, 4), dtype=np.float32))
+        return []
+
+    tracks = tracker.update(bboxes[:, :4])
+    recognition = face_model.models["recognition"]
+    pending, crops = [], []
+    for track, kps in zip(tracks, kpss):
+        if tracker.needs_embedding(track):
+            crops.append(face_align.norm_crop(img_bgr, landmark=kps, image_size=recognition.input_size[0]))
+            pending.append(track)
+            tracker.mark_embedded(track)
+    if not crops:
+        return []
+
+    embeddings = recognition.get_feat(crops)
+    return list(zip(pending, embeddings))
+
+
+# ----------------------
+# Gallery embedding theo lớp
+# ----------------------
+async def load_class_embeddings(class_id: str):
+    """Đọc embedding của tất cả sinh viên trong lớp (chỉ chạy khi gallery chưa được nạp)
+
+    Mỗi sinh viên có ảnh đăng ký chính (face_embedding) và các ảnh bổ sung
+    (face_embeddings); gallery giữ toàn bộ K embedding của sinh viên.
+    """
+    cursor = db.students.find(
+        {"class_id": class_id},
+        {"name": 1, "face_embedding": 1, "face_embeddings": 1}
+    )
+    student_ids, names, embeddings = [], [], []
+    async for student in cursor:
+        vectors = [student["face_embedding"]] if student.get("face_embedding") else []
+        vectors.extend(student.get("face_embeddings") or [])
+        if not vectors:
+            continue
+        student_ids.append(str(student["_id"]))
+        names.append(student["name"])
+        embeddings.append(vectors)
+    return student_ids, names, embeddings
+
+
+# "max": so với từng ảnh đăng ký rồi lấy điểm cao nhất; "mean": một prototype / sinh viên
+GALLERY_REDUCE = os.getenv("GALLERY_REDUCE", "max")
+gallery = FaceGallery(load_class_embeddings, reduce=GALLERY_REDUCE)
+
 
 # ----------------------
 # Teacher CRUD
@@ -81,13 +322,16 @@ async def create_student(
     if not ObjectId.is_valid(class_id):
         return {"ok": False, "msg": "class_id không hợp lệ (phải là ObjectId 24 ký tự)"}
 
+    if not face_pool.is_ready:
+        return MODEL_NOT_READY
+
     content = await file.read()
 
-    # Tính embedding trong thread pool
-    loop = asyncio.get_event_loop()
-    embedding = await loop.run_in_executor(executor, compute_embedding_insightface, content)
-    if embedding is None:
+    # Tính embedding trên model đang rảnh trong pool
+    embeddings = await embed_upload(content)
+    if embeddings is None:
         return {"ok": False, "msg": "Không tìm thấy mặt trong ảnh"}
+    embedding = embeddings[0].tolist()
 
     # Save image
     fname = f"{mssv}_{int(datetime.utcnow().timestamp())}.jpg"
@@ -111,9 +355,188 @@ async def create_student(
         {"$push": {"student_ids": str(res.inserted_id)}}
     )
 
+    # Cập nhật gallery của lớp nếu đã được nạp
+    gallery.add_student(class_id, str(res.inserted_id), name, embedding)
+
     return {"ok": True, "student_id": str(res.inserted_id)}
 
 
+@app.post("/students/{student_id}/faces/")
+async def add_student_face(student_id: str, file: UploadFile = File(...)):
+    """Thêm ảnh đăng ký bổ sung cho sinh viên (góc mặt, ánh sáng khác) để nhận diện chính xác hơn"""
+    if not ObjectId.is_valid(student_id):
+        return {"ok": False, "msg": "student_id không hợp lệ"}
+
+    student = await db.students.find_one({"_id": ObjectId(student_id)}, {"class_id": 1})
+    if not student:
+        return {"ok": False, "msg": "Không tìm thấy sinh viên"}
+
+    if not face_pool.is_ready:
+        return MODEL_NOT_READY
+
+    # Gửi lại ảnh vừa nén lại của chính học sinh này được khớp gần đúng
+    embeddings = await embed_upload(await file.read(), near_scope=f"student-face:{student_id}")
+    if embeddings is None:
+        return {"ok": False, "msg": "Không tìm thấy mặt trong ảnh"}
+    embedding = embeddings[0].tolist()
+
+    await db.students.update_one(
+        {"_id": ObjectId(student_id)},
+        {"$push": {"face_embeddings": embedding}}
+    )
+    gallery.add_embedding(student["class_id"], student_id, embedding)
+
+    return {"ok": True, "student_id": student_id}
+
+
+BULK_INSERT_CHUNK = int(os.getenv("BULK_INSERT_CHUNK", "200"))
+
+
+def read_roster(data: bytes):
+    """Đọc file CSV danh sách sinh viên: cột name, mssv, photo (tên ảnh trong zip, mặc định <mssv>.jpg)"""
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    rows = []
+    for row in reader:
+        row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+        if not row.get("name") or not row.get("mssv"):
+            continue
+        row["photo"] = row.get("photo") or f"{row['mssv']}.jpg"
+        rows.append(row)
+    return rows
+
+
+async def enroll_bulk_stream(class_id: str, rows, archive_file):
+    """Tính embedding song song trên pool, ghi DB theo lô và trả tiến độ dạng NDJSON"""
+    archive = zipfile.ZipFile(archive_file)
+    total = len(rows)
+    # Giới hạn số ảnh đang giải nén/chờ pool để bộ nhớ không phụ thuộc kích thước zip
+    semaphore = asyncio.Semaphore(face_pool.size * 2)
+    loop = asyncio.get_running_loop()
+
+    async def embed_row(row):
+        async with semaphore:
+            try:
+                # Giải nén ngoài event loop (ZipFile cho phép đọc đồng thời từ nhiều thread)
+                content = await loop.run_in_executor(None, archive.read, row["photo"])
+            except KeyError:
+                return row, None, None, "Không có ảnh trong file zip"
+            except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, EOFError) as e:
+                # Ảnh hỏng, bị mã hóa hoặc nén kiểu không hỗ trợ: chỉ lỗi dòng này, stream vẫn chạy tiếp
+                return row, None, None, f"Không đọc được ảnh trong file zip: {e}"
+            embeddings = await embed_upload(content)
+            if embeddings is None:
+                return row, None, None, "Không tìm thấy mặt trong ảnh"
+            return row, content, embeddings[0].tolist(), None
+
+    def save_photo(path, content):
+        with open(path, "wb") as f:
+            f.write(content)
+
+    def line(payload):
+        return json.dumps(payload, ensure_ascii=False) + "\n"
+
+    async def flush(docs):
+        """insert_many một lô sinh viên + một update_one cho danh sách lớp, trả về các dòng tiến độ
+
+        done tăng theo từng sinh viên được lưu nên mỗi dòng tiến độ mang một giá trị riêng.
+        """
+        nonlocal done
+        res = await db.students.insert_many(docs)
+        student_ids = [str(_id) for _id in res.inserted_ids]
+        await db.classes.update_one(
+            {"_id": ObjectId(class_id)},
+            {"$push": {"student_ids": {"$each": student_ids}}}
+        )
+        lines = []
+        for doc, student_id in zip(docs, student_ids):
+            gallery.add_student(class_id, student_id, doc["name"], doc["face_embedding"])
+            done += 1
+            lines.append(line({"event": "student", "ok": True, "mssv": doc["mssv"],
+                               "student_id": student_id, "done": done, "total": total}))
+        return lines
+
+    done = succeeded = 0
+    pending = []
+    tasks = []
+    try:
+        yield line({"event": "start", "total": total})
+        tasks = [asyncio.create_task(embed_row(row)) for row in rows]
+        for future in asyncio.as_completed(tasks):
+            row, content, embedding, error = await future
+            if error:
+                done += 1
+                yield line({"event": "student", "ok": False, "mssv": row["mssv"], "msg": error,
+                            "done": done, "total": total})
+                continue
+
+            fname = f"{row['mssv']}_{int(datetime.utcnow().timestamp())}.jpg"
+            path = os.path.join(IMAGE_DIR, fname)
+            await loop.run_in_executor(None, save_photo, path, content)
+            pending.append({
+                "name": row["name"],
+                "mssv": row["mssv"],
+                "class_id": class_id,
+                "face_embedding": embedding,
+                "avatar_url": path
+            })
+
+            if len(pending) >= BULK_INSERT_CHUNK:
+                for progress in await flush(pending):
+                    yield progress
+                succeeded += len(pending)
+                pending = []
+
+        if pending:
+            for progress in await flush(pending):
+                yield progress
+            succeeded += len(pending)
+
+        yield line({"event": "done", "total": total, "succeeded": succeeded, "failed": total - succeeded})
+    finally:
+        # Client ngắt kết nối (hoặc lỗi giữa chừng): dừng các ảnh chưa xử lý trước khi đóng zip
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        archive.close()
+        archive_file.close()
+
+
+@app.post("/students/bulk/")
+async def create_students_bulk(
+    class_id: str = Form(...),
+    roster: UploadFile = File(...),
+    photos: UploadFile = File(...)
+):
+    """Thêm hàng loạt sinh viên từ file CSV (name, mssv, photo) + file zip ảnh; trả tiến độ dạng NDJSON"""
+    if not ObjectId.is_valid(class_id):
+        return {"ok": False, "msg": "class_id không hợp lệ (phải là ObjectId 24 ký tự)"}
+    if not face_pool.is_ready:
+        return MODEL_NOT_READY
+
+    try:
+        rows = read_roster(await roster.read())
+    except (UnicodeDecodeError, csv.Error) as e:
+        return {"ok": False, "msg": f"File CSV không hợp lệ: {e}"}
+    if not rows:
+        return {"ok": False, "msg": "File CSV không có sinh viên nào"}
+
+    # Chép zip ra file tạm: UploadFile bị đóng khi endpoint trả về, trước khi stream chạy xong
+    archive_file = tempfile.TemporaryFile()
+    await photos.seek(0)
+    await asyncio.get_running_loop().run_in_executor(None, shutil.copyfileobj, photos.file, archive_file)
+    archive_file.seek(0)
+    if not zipfile.is_zipfile(archive_file):
+        archive_file.close()
+        return {"ok": False, "msg": "File ảnh phải là file zip"}
+    archive_file.seek(0)
+
+    return StreamingResponse(
+        enroll_bulk_stream(class_id, rows, archive_file),
+        media_type="application/x-ndjson"
+    )
+
+
 # ----------------------
 # Attendance manual
 # ----------------------
@@ -139,41 +562,131 @@ async def mark_attendance(class_id: str = Form(...), student_id: str = Form(...)
 # AI Recognition / Điểm danh tự động
 # ----------------------
 @app.post("/recognize/")
-async def recognize(file: UploadFile = File(...), class_id: str = Form(...)):
+async def recognize(
+    file: UploadFile = File(...),
+    class_id: str = Form(...),
+    multi_face: bool = Form(False)
+):
     # Validate class_id
     if not ObjectId.is_valid(class_id):
         return {"ok": False, "msg": "class_id không hợp lệ"}
+    if not face_pool.is_ready:
+        return MODEL_NOT_READY
 
     content = await file.read()
 
-    loop = asyncio.get_event_loop()
-    emb = await loop.run_in_executor(executor, compute_embedding_insightface, content)
-    if emb is None:
+    embs = await embed_upload(content)
+    if embs is None:
         return {"ok": True, "results": [], "msg": "Không nhận diện được mặt"}
 
-    emb_norm = np.array(emb) / np.linalg.norm(emb)
-
-    # Lấy toàn bộ sinh viên của lớp
-    cursor = db.students.find({"class_id": class_id})
+    if multi_face:
+        # Ảnh cả lớp: đối chiếu mọi khuôn mặt (faces x students) một lần
+        matches = await gallery.match_many(class_id, embs, MATCH_THRESHOLD)
+    else:
+        # Đối chiếu mặt đầu tiên với gallery của lớp (một phép nhân ma trận-vector)
+        matches = await gallery.match(class_id, embs[0], MATCH_THRESHOLD)
     results = []
 
-    async for student in cursor:
-        student_emb = np.array(student["face_embedding"])
-        student_emb_norm = student_emb / np.linalg.norm(student_emb)
-        score = float(np.dot(emb_norm, student_emb_norm))
-
-        if score >= 0.7:  # ngưỡng 70%
-            results.append({
-                "name": student["name"],
-                "score": score
-            })
+    for match in matches:
+        result = {
+            "name": match["name"],
+            "score": match["score"]
+        }
+        if "face_index" in match:
+            result["face_index"] = match["face_index"]
+        results.append(result)
+
+        # Tự động điểm danh (ghi theo lô ở nền)
+        record_attendance(class_id, match["student_id"])
+
+    return {"ok": True, "results": results}
 
-            # Tự động điểm danh
-            await db.attendance.insert_one({
-                "class_id": class_id,
-                "student_id": str(student["_id"]),  # vẫn lưu trong DB để quản lý
-                "time": datetime.utcnow(),
-                "status": "present"
-            })
 
-    return {"ok": True, "results": results}
\ No newline at end of file
+# ----------------------
+# Camera stream / Điểm danh từ luồng camera
+# ----------------------
+STREAM_FPS = float(os.getenv("STREAM_FPS", "2"))
+
+stream_workers = {}
+stream_trackers = {}
+
+
+async def process_stream_frame(camera_id: str, class_id: str, frame):
+    """Nhận diện một khung hình lấy từ camera và ghi điểm danh kèm camera_id.
+
+    Nhờ tracker, mỗi khuôn mặt chỉ được embedding khi track mới xuất hiện
+    hoặc chưa được nhận diện chắc chắn.
+    """
+    if not face_pool.is_ready:
+        return
+    tracker = stream_trackers[camera_id]
+    pending = await face_pool.run(track_and_embed_bgr, tracker, frame)
+    if not pending:
+        return
+
+    embs = np.stack([emb for _, emb in pending])
+    matches = await gallery.match_many(class_id, embs, MATCH_THRESHOLD)
+    for match in matches:
+        track = pending[match["face_index"]][0]
+        previous = track.student_id
+        tracker.assign(track, match["student_id"], match["name"], match["score"])
+        if track.student_id == previous:
+            continue
+        record_attendance(class_id, match["student_id"], camera_id)
+
+
+@app.post("/streams/")
+async def start_stream(
+    camera_id: str = Form(...),
+    class_id: str = Form(...),
+    source: str = Form(None),
+    fps: float = Form(None)
+):
+    """Bắt đầu đọc camera; nếu không truyền source thì lấy từ bảng cameras (MySQL)"""
+    if not ObjectId.is_valid(class_id):
+        return {"ok": False, "msg": "class_id không hợp lệ"}
+    if camera_id in stream_workers and stream_workers[camera_id].running:
+        return {"ok": False, "msg": "Camera đang chạy"}
+
+    loop = asyncio.get_running_loop()
+    if not source:
+        if not camera_id.isdigit():
+            return {"ok": False, "msg": "Cần source cho camera không có trong bảng cameras"}
+        camera = await run_db(CamerasRepository.get_camera_by_id, int(camera_id))
+        source = camera_source(camera) if camera else None
+        if not source:
+            return {"ok": False, "msg": "Không tìm thấy nguồn video của camera"}
+
+    def on_frame(frame):
+        # Gọi từ thread camera: đẩy khung hình vào event loop
+        return asyncio.run_coroutine_threadsafe(
+            process_stream_frame(camera_id, class_id, frame), loop
+        )
+
+    worker = CameraStreamWorker(camera_id, source, on_frame, fps=fps or STREAM_FPS)
+    stream_trackers[camera_id] = FaceTracker()
+    stream_workers[camera_id] = worker
+    worker.start()
+    return {"ok": True, "stream": worker.stats()}
+
+
+def stream_stats(camera_id: str):
+    stats = stream_workers[camera_id].stats()
+    stats["tracker"] = stream_trackers[camera_id].stats()
+    return stats
+
+
+@app.get("/streams/")
+async def list_streams():
+    return {"ok": True, "streams": [stream_stats(camera_id) for camera_id in stream_workers]}
+
+
+@app.delete("/streams/{camera_id}")
+async def stop_stream(camera_id: str):
+    if camera_id not in stream_workers:
+        return {"ok": False, "msg": "Camera không chạy"}
+    await asyncio.get_running_loop().run_in_executor(None, stream_workers[camera_id].stop)
+    stats = stream_stats(camera_id)
+    del stream_workers[camera_id]
+    del stream_trackers[camera_id]
+    return {"ok": True, "stream": stats}
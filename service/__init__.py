@@ -2,7 +2,7 @@
 Service module - Các repository để trích xuất và quản lý dữ liệu từ MySQL database
 """
 
-from service.db_connection import db, DatabaseConnection
+from service.db_connection import db, DatabaseConnection, PoolTimeoutError
 from service.students import StudentsRepository
 from service.teachers import TeachersRepository
 from service.classes import ClassesRepository
@@ -13,6 +13,7 @@ from service.attendance import AttendanceRepository
 __all__ = [
     'db',
     'DatabaseConnection',
+    'PoolTimeoutError',
     'StudentsRepository',
     'TeachersRepository',
     'ClassesRepository',
@@ -0,0 +1,224 @@
+"""
+Chỉ mục tìm kiếm gần đúng (ANN) kiểu IVF cho toàn bộ face embeddings của trường.
+
+Embedding được chuẩn hóa rồi phân cụm bằng spherical k-means thành nlist cụm;
+mỗi truy vấn chỉ so sánh với các vector thuộc nprobe cụm gần nhất thay vì toàn bộ.
+Viết hoàn toàn bằng NumPy, lưu/đọc bằng một file .npz.
+
+Chưa được dùng trong luồng nhận diện: main.py so khớp trong gallery của từng lớp
+(FaceGallery, vài chục học sinh) nên quét toàn bộ đã đủ nhanh. Chỉ mục dành cho
+tìm kiếm toàn trường (CLI bên dưới, benchmarks/bench_ann_index.py).
+
+Recall (benchmarks/bench_ann_index.py, 20k embedding, nprobe mặc định 32): các
+ảnh cùng người (điểm cao) gần như luôn được tìm thấy, nhưng các láng giềng xa
+(cosine ~0, khác người) trong top-k chỉ tìm được khi nprobe gần bằng nlist.
+
+Chạy trực tiếp để dựng chỉ mục từ MySQL và ghi ra đĩa:
+    python -m service.ann_index [đường_dẫn.npz]
+"""
+
+import os
+import sys
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from service.face_gallery import normalize_rows
+
+DEFAULT_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "data/ann_index.npz")
+# Lấy dư ứng viên khi query để còn đủ k học sinh khác nhau sau khi gộp nhiều embedding/học sinh
+QUERY_OVERSAMPLE = 4
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, n_iter: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means (cosine) trên các vector đã chuẩn hóa, trả về tâm cụm đã chuẩn hóa"""
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=nlist)
+        # Cụm rỗng: lấy lại một điểm ngẫu nhiên làm tâm
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Chỉ mục inverted-file: vector được xếp liền nhau theo cụm, offsets[i]:offsets[i+1] là cụm i"""
+
+    def __init__(self, nprobe: int = 32):
+        self.nprobe = nprobe
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.student_ids = np.empty(0, dtype=np.int64)
+        self.student_names = np.empty(0, dtype=str)
+        self.student_codes = np.empty(0, dtype=str)
+        self.class_ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def build(
+        self,
+        embeddings,
+        student_ids,
+        student_names=None,
+        student_codes=None,
+        class_ids=None,
+        nlist: Optional[int] = None,
+        n_iter: int = 10,
+        train_size: int = 50000,
+        seed: int = 0
+    ) -> "IVFIndex":
+        """Dựng chỉ mục từ ma trận embedding (N x D) và các mảng thông tin học sinh tương ứng"""
+        vectors = normalize_rows(embeddings)
+        n = len(vectors)
+        if n == 0:
+            raise ValueError("Không có embedding nào để dựng chỉ mục")
+        if nlist is None:
+            # ~4*sqrt(N) cụm: mỗi cụm vài chục vector với N cỡ chục nghìn
+            nlist = int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+
+        rng = np.random.default_rng(seed)
+        train = vectors if n <= train_size else vectors[rng.choice(n, train_size, replace=False)]
+        self.centroids = _kmeans(train, nlist, n_iter, rng)
+
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.student_ids = np.asarray(student_ids, dtype=np.int64)[order]
+        self.student_names = np.asarray(student_names if student_names is not None else [""] * n, dtype=str)[order]
+        self.student_codes = np.asarray(student_codes if student_codes is not None else [""] * n, dtype=str)[order]
+        self.class_ids = np.asarray(class_ids if class_ids is not None else [0] * n, dtype=np.int64)[order]
+        return self
+
+    def _probe(self, query: np.ndarray, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Tính điểm với các vector thuộc nprobe cụm gần query nhất, trả về (scores, positions)"""
+        nprobe = min(nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+        # Mỗi cụm là một đoạn liền nhau: nhân trực tiếp trên slice, không cần copy
+        starts, ends = self.offsets[probes], self.offsets[probes + 1]
+        scores = np.concatenate([self.vectors[s:e] @ query for s, e in zip(starts, ends)])
+        positions = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+        return scores, positions
+
+    def search(self, embedding, k: int = 5, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Tìm top-k, trả về (scores, positions) sắp xếp theo điểm giảm dần"""
+        query = normalize_rows(embedding)[0]
+        scores, positions = self._probe(query, nprobe or self.nprobe)
+        if len(scores) == 0:
+            return scores, positions
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return scores[top], positions[top]
+
+    def query(self, embedding, k: int = 5, threshold: float = 0.0, nprobe: Optional[int] = None) -> List[Dict]:
+        """Tìm top-k học sinh gần nhất có điểm >= threshold
+
+        Một học sinh có thể có nhiều embedding trong chỉ mục; chỉ giữ embedding có
+        điểm cao nhất (max-over-K) nên kết quả là k học sinh khác nhau.
+        """
+        scores, positions = self.search(embedding, k * QUERY_OVERSAMPLE, nprobe)
+        keep = scores >= threshold
+        scores, positions = scores[keep], positions[keep]
+        # positions đã sắp theo điểm giảm dần nên lần xuất hiện đầu tiên là điểm cao nhất
+        _, first = np.unique(self.student_ids[positions], return_index=True)
+        first = np.sort(first)[:k]
+        return [
+            {
+                "student_id": int(self.student_ids[p]),
+                "student_name": str(self.student_names[p]),
+                "student_code": str(self.student_codes[p]),
+                "class_id": int(self.class_ids[p]),
+                "score": float(score)
+            }
+            for score, p in zip(scores[first], positions[first])
+        ]
+
+    def brute_force_search(self, embedding, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Tìm chính xác top-k trên toàn bộ vector (dùng để đo recall)"""
+        query = normalize_rows(embedding)[0]
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return scores[top], top
+
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        """Lưu chỉ mục ra file .npz"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(
+            path,
+            nprobe=np.int64(self.nprobe),
+            centroids=self.centroids,
+            vectors=self.vectors,
+            offsets=self.offsets,
+            student_ids=self.student_ids,
+            student_names=self.student_names,
+            student_codes=self.student_codes,
+            class_ids=self.class_ids
+        )
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH) -> "IVFIndex":
+        """Đọc chỉ mục từ file .npz"""
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(nprobe=int(data["nprobe"]))
+            index.centroids = data["centroids"]
+            index.vectors = data["vectors"]
+            index.offsets = data["offsets"]
+            index.student_ids = data["student_ids"]
+            index.student_names = data["student_names"]
+            index.student_codes = data["student_codes"]
+            index.class_ids = data["class_ids"]
+        return index
+
+    @classmethod
+    def from_repository(cls, nprobe: int = 32, nlist: Optional[int] = None, latest_only: bool = False) -> "IVFIndex":
+        """Dựng chỉ mục từ FaceEmbeddingsRepository.get_all_embeddings_for_recognition (mặc định toàn bộ K embedding)"""
+        from service.face_embeddings import FaceEmbeddingsRepository
+
+        rows = [
+            row for row in FaceEmbeddingsRepository.get_all_embeddings_for_recognition(latest_only)
+            if row.get('embedding') is not None
+        ]
+        return cls(nprobe=nprobe).build(
+            [row['embedding'] for row in rows],
+            [row['student_id'] for row in rows],
+            [row['student_name'] for row in rows],
+            [row['student_code'] or "" for row in rows],
+            [row['class_id'] for row in rows],
+            nlist=nlist
+        )
+
+
+if __name__ == "__main__":
+    from service.db_connection import db
+
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_INDEX_PATH
+    if not db.connect():
+        sys.exit(1)
+    try:
+        index = IVFIndex.from_repository()
+        index.save(path)
+        print(f"✓ Đã dựng chỉ mục: {len(index)} embeddings, {index.nlist} cụm -> {path}")
+    finally:
+        db.disconnect()
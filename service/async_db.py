@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, TypeVar
+
+from service.db_connection import db
+from service.metrics import REGISTRY
+
+T = TypeVar("T")
+
+# Số query MySQL chạy đồng thời tối đa (mỗi thread trong pool giữ một kết nối riêng)
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="db")
+_lock = threading.Lock()
+_in_flight = 0
+_submitted = 0
+_completed = 0
+
+
+def _call(func: Callable, args, kwargs):
+    global _in_flight, _completed
+    with _lock:
+        _in_flight += 1
+    try:
+        return func(*args, **kwargs)
+    finally:
+        with _lock:
+            _in_flight -= 1
+            _completed += 1
+
+
+def _submit(func: Callable, *args, **kwargs):
+    global _submitted
+    with _lock:
+        _submitted += 1
+    return _executor.submit(_call, func, args, kwargs)
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Chạy một hàm truy cập DB đồng bộ (Repository) trong thread pool riêng của DB.
+
+    Event loop không bị chặn trong lúc chờ MySQL; tối đa DB_MAX_CONCURRENCY query
+    chạy cùng lúc, các query còn lại xếp hàng trong pool.
+    """
+    return await asyncio.wrap_future(_submit(func, *args, **kwargs))
+
+
+async def iterate_db(iterator: Iterator[T]) -> AsyncIterator[T]:
+    """Duyệt một generator DB đồng bộ (vd. db.stream_query) từ code async, mỗi bước chạy trong thread pool DB
+
+    Khi người dùng dừng giữa chừng (client ngắt kết nối), generator được đóng
+    trong thread DB sau khi bước đang chạy xong để kết nối được trả lại pool.
+    """
+    future = None
+    try:
+        while True:
+            future = _submit(next, iterator, None)
+            item = await asyncio.wrap_future(future)
+            if item is None:
+                return
+            yield item
+    finally:
+        def close(_=None):
+            try:
+                _submit(iterator.close)
+            except RuntimeError:
+                # Thread pool đã dừng (ứng dụng đang tắt)
+                pass
+
+        if future is None or future.done():
+            close()
+        else:
+            future.add_done_callback(close)
+
+
+def shutdown():
+    """Dừng thread pool DB (gọi khi tắt ứng dụng, sau khi các request đã xong)"""
+    _executor.shutdown(wait=False)
+
+
+def stats() -> Dict:
+    """Thống kê thread pool DB: đang chạy, đang xếp hàng, đã xong"""
+    with _lock:
+        return {
+            "max_concurrency": DB_MAX_CONCURRENCY,
+            "in_flight": _in_flight,
+            "queued": _submitted - _completed - _in_flight,
+            "completed": _completed
+        }
+
+
+def register_metrics():
+    """Đăng ký gauge cho pool kết nối MySQL và thread pool DB vào /metrics"""
+    REGISTRY.gauge(
+        "db_pool_connections", "Kết nối MySQL trong pool theo trạng thái", ("state",),
+        callback=lambda: {
+            (state,): value for state, value in db.stats().items()
+            if state in ("open", "idle", "in_use", "waiting")
+        }
+    )
+    REGISTRY.gauge(
+        "db_pool_size", "Số kết nối tối đa của pool MySQL",
+        callback=lambda: db.pool_size
+    )
+    REGISTRY.gauge(
+        "db_workers", "Thread pool DB theo trạng thái", ("state",),
+        callback=lambda: {(state,): stats()[state] for state in ("in_flight", "queued")}
+    )
@@ -1,7 +1,120 @@
 from service.db_connection import db
-from typing import List, Dict, Optional
-from datetime import datetime, date
+from service.metrics import instrument_repository
+from service.pagination import clamp_limit, decode_cursor, make_page
+from service.batch_loader import query_in
+from typing import Iterator, List, Dict, Optional
+from datetime import datetime, date, time, timedelta
 
+
+def _day_range(start_date: date, end_date: date = None):
+    """Khoảng nửa mở [00:00 start_date, 00:00 ngày sau end_date) cho cột timestamp
+    
+    So sánh trực tiếp với cột nên dùng được index, khác với DATE(timestamp) = ...
+    """
+    end_date = end_date or start_date
+    return datetime.combine(start_date, time.min), datetime.combine(end_date + timedelta(days=1), time.min)
+
+
+# Số khóa (học sinh, lớp, ngày) mỗi lần tính lại bảng tổng hợp
+_SUMMARY_CHUNK = 500
+
+_SUMMARY_COLUMNS = """
+    attendance_date, class_id, student_id, camera_id,
+    total_records, present_count, absent_count, late_count, excused_count
+"""
+
+_SUMMARY_SELECT = """
+    SELECT
+        attendance_date, class_id, student_id, IFNULL(camera_id, 0),
+        COUNT(*),
+        SUM(status = 'present'),
+        SUM(status = 'absent'),
+        SUM(status = 'late'),
+        SUM(status = 'excused')
+    FROM attendance
+"""
+
+_SUMMARY_TOTALS = """
+    SELECT
+        CAST(COALESCE(SUM(total_records), 0) AS SIGNED) as total_records,
+        CAST(COALESCE(SUM(present_count), 0) AS SIGNED) as present_count,
+        CAST(COALESCE(SUM(absent_count), 0) AS SIGNED) as absent_count,
+        CAST(COALESCE(SUM(late_count), 0) AS SIGNED) as late_count,
+        CAST(COALESCE(SUM(excused_count), 0) AS SIGNED) as excused_count
+    FROM attendance_daily_summary
+"""
+
+
+def empty_statistics() -> Dict:
+    """Thống kê điểm danh khi chưa có bản ghi nào"""
+    return {
+        'total_records': 0,
+        'present_count': 0,
+        'absent_count': 0,
+        'late_count': 0,
+        'excused_count': 0
+    }
+
+
+def _summary_key(student_id: int, class_id: int, timestamp: datetime) -> tuple:
+    return (student_id, class_id, timestamp.date())
+
+
+def _refresh_daily_summary(cursor, keys) -> None:
+    """Tính lại các dòng attendance_daily_summary của những (học sinh, lớp, ngày) vừa thay đổi
+    
+    Chạy trên cursor của transaction đang ghi attendance nên bảng tổng hợp luôn
+    khớp với dữ liệu gốc. Tính lại từ attendance (dùng idx_attendance_day)
+    thay vì cộng dồn, nên đúng cả khi bản ghi trùng bị bỏ qua.
+    """
+    keys = sorted(set(keys))
+    for i in range(0, len(keys), _SUMMARY_CHUNK):
+        chunk = keys[i:i + _SUMMARY_CHUNK]
+        placeholders = ", ".join(["(%s, %s, %s)"] * len(chunk))
+        params = tuple(value for key in chunk for value in key)
+        cursor.execute(f"""
+            DELETE FROM attendance_daily_summary
+            WHERE (student_id, class_id, attendance_date) IN ({placeholders})
+        """, params)
+        cursor.execute(f"""
+            INSERT INTO attendance_daily_summary ({_SUMMARY_COLUMNS})
+            {_SUMMARY_SELECT}
+            WHERE (student_id, class_id, attendance_date) IN ({placeholders})
+            GROUP BY attendance_date, class_id, student_id, IFNULL(camera_id, 0)
+        """, params)
+
+
+def _recognition_key(row: tuple) -> tuple:
+    """Khóa uq_attendance_session của một dòng (student_id, class_id, timestamp, session, ...)"""
+    return (row[0], row[1], row[2].date(), row[3])
+
+
+def _fetch_recognition_ids(cursor, keys) -> Dict[tuple, int]:
+    """{(học sinh, lớp, ngày, ca): attendance_id} của các bản ghi tự động, đọc trong transaction hiện tại"""
+    keys = sorted(set(keys))
+    found = {}
+    for i in range(0, len(keys), _SUMMARY_CHUNK):
+        chunk = keys[i:i + _SUMMARY_CHUNK]
+        placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(chunk))
+        cursor.execute(f"""
+            SELECT attendance_id, student_id, class_id, recognition_date, session
+            FROM attendance
+            WHERE (student_id, class_id, recognition_date, session) IN ({placeholders})
+        """, tuple(value for key in chunk for value in key))
+        for attendance_id, student_id, class_id, day, session in cursor.fetchall():
+            found[(student_id, class_id, day, session)] = attendance_id
+    return found
+
+
+def _fetch_summary_key(cursor, attendance_id: int) -> Optional[tuple]:
+    cursor.execute(
+        "SELECT student_id, class_id, attendance_date FROM attendance WHERE attendance_id = %s",
+        (attendance_id,)
+    )
+    row = cursor.fetchone()
+    return tuple(row) if row else None
+
+@instrument_repository
 class AttendanceRepository:
     """Repository để trích xuất và quản lý dữ liệu điểm danh"""
     
@@ -32,6 +145,46 @@ class AttendanceRepository:
         """
         return db.execute_query(query)
     
+    @staticmethod
+    def get_attendance_page(limit: int = None, cursor: str = None) -> Dict:
+        """Lấy một trang điểm danh, mới nhất trước (phân trang keyset theo timestamp, attendance_id)
+        
+        Trả về {"items", "next_cursor", "limit"}; truyền next_cursor để lấy trang sau.
+        """
+        limit = clamp_limit(limit)
+        where = ""
+        params: tuple = ()
+        if cursor:
+            last_timestamp, last_id = decode_cursor(cursor, 2)
+            where = "WHERE a.timestamp < %s OR (a.timestamp = %s AND a.attendance_id < %s)"
+            params = (last_timestamp, last_timestamp, last_id)
+        query = f"""
+            SELECT 
+                a.attendance_id,
+                a.student_id,
+                a.class_id,
+                a.timestamp,
+                a.session,
+                a.status,
+                a.method,
+                a.camera_id,
+                a.note,
+                s.full_name as student_name,
+                s.student_code,
+                c.class_name,
+                cam.camera_name,
+                cam.location as camera_location
+            FROM attendance a
+            JOIN students s ON a.student_id = s.student_id
+            JOIN classes c ON a.class_id = c.class_id
+            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
+            {where}
+            ORDER BY a.timestamp DESC, a.attendance_id DESC
+            LIMIT %s
+        """
+        results = db.execute_query(query, params + (limit + 1,))
+        return make_page(results, limit, ('timestamp', 'attendance_id'))
+    
     @staticmethod
     def get_attendance_by_id(attendance_id: int) -> Optional[Dict]:
         """Lấy bản ghi điểm danh theo ID"""
@@ -114,6 +267,61 @@ class AttendanceRepository:
         """
         return db.execute_query(query, (class_id,))
     
+    @staticmethod
+    def stream_attendance(
+        class_id: int = None,
+        student_id: int = None,
+        start_date: date = None,
+        end_date: date = None,
+        status: str = None,
+        chunk_size: int = 1000
+    ) -> Iterator[List[Dict]]:
+        """Đọc lịch sử điểm danh đã lọc theo từng lô (dùng để xuất file, không nạp hết vào bộ nhớ)
+
+        Khoảng ngày là [start_date, end_date] (bao gồm cả hai đầu).
+        """
+        conditions = []
+        params = []
+        if class_id is not None:
+            conditions.append("a.class_id = %s")
+            params.append(class_id)
+        if student_id is not None:
+            conditions.append("a.student_id = %s")
+            params.append(student_id)
+        if start_date is not None:
+            conditions.append("a.timestamp >= %s")
+            params.append(_day_range(start_date)[0])
+        if end_date is not None:
+            conditions.append("a.timestamp < %s")
+            params.append(_day_range(end_date)[1])
+        if status is not None:
+            conditions.append("a.status = %s")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT
+                a.attendance_id,
+                a.student_id,
+                s.student_code,
+                s.full_name as student_name,
+                a.class_id,
+                c.class_name,
+                a.timestamp,
+                a.session,
+                a.status,
+                a.method,
+                a.camera_id,
+                cam.camera_name,
+                a.note
+            FROM attendance a
+            JOIN students s ON a.student_id = s.student_id
+            JOIN classes c ON a.class_id = c.class_id
+            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
+            {where}
+            ORDER BY a.timestamp, a.attendance_id
+        """
+        return db.stream_query(query, tuple(params), chunk_size)
+
     @staticmethod
     def get_attendance_by_date(attendance_date: date) -> List[Dict]:
         """Lấy điểm danh theo ngày"""
@@ -136,10 +344,10 @@ class AttendanceRepository:
             JOIN students s ON a.student_id = s.student_id
             JOIN classes c ON a.class_id = c.class_id
             LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE DATE(a.timestamp) = %s
+            WHERE a.timestamp >= %s AND a.timestamp < %s
             ORDER BY a.timestamp DESC
         """
-        return db.execute_query(query, (attendance_date,))
+        return db.execute_query(query, _day_range(attendance_date))
     
     @staticmethod
     def get_attendance_by_class_and_date(class_id: int, attendance_date: date) -> List[Dict]:
@@ -163,10 +371,10 @@ class AttendanceRepository:
             JOIN students s ON a.student_id = s.student_id
             JOIN classes c ON a.class_id = c.class_id
             LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE a.class_id = %s AND DATE(a.timestamp) = %s
+            WHERE a.class_id = %s AND a.timestamp >= %s AND a.timestamp < %s
             ORDER BY a.timestamp DESC
         """
-        return db.execute_query(query, (class_id, attendance_date))
+        return db.execute_query(query, (class_id,) + _day_range(attendance_date))
     
     @staticmethod
     def get_attendance_by_status(status: str) -> List[Dict]:
@@ -243,8 +451,66 @@ class AttendanceRepository:
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
         params = (student_id, class_id, timestamp, session, status, method, camera_id, note)
-        _, last_id = db.execute_update(query, params)
-        return last_id
+
+        def write(cursor):
+            cursor.execute(query, params)
+            _refresh_daily_summary(cursor, [_summary_key(student_id, class_id, timestamp)])
+            return cursor.lastrowid
+
+        return db.execute_transaction(write)
+    
+    @staticmethod
+    def create_attendance_many(records: List[Dict], ignore_duplicates: bool = False) -> List[Optional[int]]:
+        """Tạo nhiều bản ghi điểm danh trong một transaction, trả về ID theo thứ tự records
+        
+        Mỗi record là dict với các khóa giống tham số của create_attendance. Ghi bằng
+        INSERT nhiều dòng, mỗi câu tối đa DB_BATCH_SIZE dòng; lỗi ở bất kỳ lô nào thì
+        không ghi gì và trả về [].
+        
+        ignore_duplicates=True bỏ qua bản ghi tự động trùng (học sinh, lớp, ngày, ca)
+        bằng ON DUPLICATE KEY UPDATE thay vì làm hỏng cả lô; bản ghi bị bỏ qua nhận ID
+        của bản ghi đã có. Chỉ xung đột khóa UNIQUE được bỏ qua: lỗi khóa ngoại, giá
+        trị ENUM sai... vẫn rollback cả lô (khác INSERT IGNORE biến chúng thành cảnh báo).
+        """
+        columns = "(student_id, class_id, timestamp, session, status, method, camera_id, note)"
+        insert_query = f"INSERT INTO attendance {columns} VALUES {{values}}"
+        upsert_query = insert_query + " ON DUPLICATE KEY UPDATE attendance_id = attendance_id"
+        rows = [
+            (
+                r['student_id'],
+                r['class_id'],
+                r.get('timestamp') or datetime.now(),
+                r['session'],
+                r['status'],
+                r.get('method', 'face_recognition'),
+                r.get('camera_id'),
+                r.get('note')
+            )
+            for r in records
+        ]
+        if not rows:
+            return []
+
+        def write(cursor):
+            if not ignore_duplicates:
+                ids = db.insert_many(cursor, insert_query, rows)
+            else:
+                ids = [None] * len(rows)
+                # Điểm danh thủ công không thuộc khóa UNIQUE: ghi thường và lấy ID như trên
+                manual = [i for i, row in enumerate(rows) if row[5] == 'manual']
+                for i, attendance_id in zip(manual, db.insert_many(cursor, insert_query, [rows[i] for i in manual])):
+                    ids[i] = attendance_id
+                # Bản ghi tự động: ID (mới hoặc đã có) đọc lại theo khóa UNIQUE
+                automatic = [i for i, row in enumerate(rows) if row[5] != 'manual']
+                if automatic:
+                    db.insert_many(cursor, upsert_query, [rows[i] for i in automatic], return_ids=False)
+                    found = _fetch_recognition_ids(cursor, [_recognition_key(rows[i]) for i in automatic])
+                    for i in automatic:
+                        ids[i] = found.get(_recognition_key(rows[i]))
+            _refresh_daily_summary(cursor, [_summary_key(r[0], r[1], r[2]) for r in rows])
+            return ids
+
+        return db.execute_transaction(write) or []
     
     @staticmethod
     def update_attendance(
@@ -272,89 +538,88 @@ class AttendanceRepository:
         
         params.append(attendance_id)
         query = f"UPDATE attendance SET {', '.join(updates)} WHERE attendance_id = %s"
-        affected_rows, _ = db.execute_update(query, tuple(params))
-        return affected_rows > 0
+
+        def write(cursor):
+            cursor.execute(query, tuple(params))
+            affected_rows = cursor.rowcount
+            # Chỉ status ảnh hưởng đến bảng tổng hợp
+            if status and affected_rows > 0:
+                key = _fetch_summary_key(cursor, attendance_id)
+                if key:
+                    _refresh_daily_summary(cursor, [key])
+            return affected_rows > 0
+
+        return db.execute_transaction(write, default=False)
     
     @staticmethod
     def delete_attendance(attendance_id: int) -> bool:
         """Xóa bản ghi điểm danh"""
-        query = "DELETE FROM attendance WHERE attendance_id = %s"
-        affected_rows, _ = db.execute_update(query, (attendance_id,))
-        return affected_rows > 0
+        def write(cursor):
+            key = _fetch_summary_key(cursor, attendance_id)
+            if key is None:
+                return False
+            cursor.execute("DELETE FROM attendance WHERE attendance_id = %s", (attendance_id,))
+            affected_rows = cursor.rowcount
+            _refresh_daily_summary(cursor, [key])
+            return affected_rows > 0
+
+        return db.execute_transaction(write, default=False)
+    
+    @staticmethod
+    def rebuild_daily_summary(start_date: date, end_date: date) -> int:
+        """Tính lại bảng tổng hợp cho khoảng ngày [start_date, end_date] từ attendance, trả về số dòng tổng hợp"""
+        def write(cursor):
+            cursor.execute(
+                "DELETE FROM attendance_daily_summary WHERE attendance_date BETWEEN %s AND %s",
+                (start_date, end_date)
+            )
+            cursor.execute(f"""
+                INSERT INTO attendance_daily_summary ({_SUMMARY_COLUMNS})
+                {_SUMMARY_SELECT}
+                WHERE timestamp >= %s AND timestamp < %s
+                GROUP BY attendance_date, class_id, student_id, IFNULL(camera_id, 0)
+            """, _day_range(start_date, end_date))
+            return cursor.rowcount
+
+        return db.execute_transaction(write, default=-1)
     
     @staticmethod
     def get_attendance_statistics_by_class(class_id: int, start_date: date = None, end_date: date = None) -> Dict:
-        """Lấy thống kê điểm danh của một lớp"""
+        """Lấy thống kê điểm danh của một lớp (đọc từ bảng tổng hợp theo ngày)"""
+        query = _SUMMARY_TOTALS + " WHERE class_id = %s"
+        params: tuple = (class_id,)
         if start_date and end_date:
-            query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_count,
-                    SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                    SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_count,
-                    SUM(CASE WHEN status = 'excused' THEN 1 ELSE 0 END) as excused_count
-                FROM attendance
-                WHERE class_id = %s 
-                AND DATE(timestamp) BETWEEN %s AND %s
-            """
-            params = (class_id, start_date, end_date)
-        else:
-            query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_count,
-                    SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                    SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_count,
-                    SUM(CASE WHEN status = 'excused' THEN 1 ELSE 0 END) as excused_count
-                FROM attendance
-                WHERE class_id = %s
-            """
-            params = (class_id,)
+            query += " AND attendance_date BETWEEN %s AND %s"
+            params += (start_date, end_date)
         
         results = db.execute_query(query, params)
-        return results[0] if results else {
-            'total_records': 0,
-            'present_count': 0,
-            'absent_count': 0,
-            'late_count': 0,
-            'excused_count': 0
-        }
+        return results[0] if results else empty_statistics()
+    
+    @staticmethod
+    def get_attendance_statistics_by_classes(class_ids: List[int]) -> Dict[int, Dict]:
+        """Lấy thống kê điểm danh của nhiều lớp bằng một query, trả về {class_id: thống kê}"""
+        query = """
+            SELECT
+                class_id,
+                CAST(SUM(total_records) AS SIGNED) as total_records,
+                CAST(SUM(present_count) AS SIGNED) as present_count,
+                CAST(SUM(absent_count) AS SIGNED) as absent_count,
+                CAST(SUM(late_count) AS SIGNED) as late_count,
+                CAST(SUM(excused_count) AS SIGNED) as excused_count
+            FROM attendance_daily_summary
+            WHERE class_id IN ({keys})
+            GROUP BY class_id
+        """
+        return {row.pop('class_id'): row for row in query_in(query, class_ids)}
     
     @staticmethod
     def get_student_attendance_summary(student_id: int, start_date: date = None, end_date: date = None) -> Dict:
-        """Lấy tổng hợp điểm danh của một học sinh"""
+        """Lấy tổng hợp điểm danh của một học sinh (đọc từ bảng tổng hợp theo ngày)"""
+        query = _SUMMARY_TOTALS + " WHERE student_id = %s"
+        params: tuple = (student_id,)
         if start_date and end_date:
-            query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_count,
-                    SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                    SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_count,
-                    SUM(CASE WHEN status = 'excused' THEN 1 ELSE 0 END) as excused_count
-                FROM attendance
-                WHERE student_id = %s 
-                AND DATE(timestamp) BETWEEN %s AND %s
-            """
-            params = (student_id, start_date, end_date)
-        else:
-            query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_count,
-                    SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                    SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_count,
-                    SUM(CASE WHEN status = 'excused' THEN 1 ELSE 0 END) as excused_count
-                FROM attendance
-                WHERE student_id = %s
-            """
-            params = (student_id,)
+            query += " AND attendance_date BETWEEN %s AND %s"
+            params += (start_date, end_date)
         
         results = db.execute_query(query, params)
-        return results[0] if results else {
-            'total_records': 0,
-            'present_count': 0,
-            'absent_count': 0,
-            'late_count': 0,
-            'excused_count': 0
-        }
-
+        return results[0] if results else empty_statistics()
@@ -0,0 +1,152 @@
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from service.ttl_cache import TTLCache
+
+AttendanceSink = Callable[[List[Dict]], Awaitable[object]]
+DropCallback = Callable[[List[Dict]], None]
+
+
+class AttendanceWriter:
+    """Gom các bản ghi điểm danh từ luồng nhận diện và ghi theo lô (write-behind).
+
+    Lô được xả khi đủ max_batch_size bản ghi hoặc sau flush_interval giây,
+    và được xả nốt khi stop() (lúc tắt ứng dụng).
+
+    Hàng đợi giữ tối đa max_pending bản ghi (kể cả khi DB lỗi lâu): bản ghi vượt
+    giới hạn bị bỏ, được đếm trong dropped và báo cho on_drop (vd. để bộ chặn
+    trùng quên chúng và cho phép ghi lại ở lần nhận diện sau).
+    """
+
+    def __init__(
+        self,
+        sink: AttendanceSink,
+        max_batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        on_drop: Optional[DropCallback] = None
+    ):
+        self._sink = sink
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        # Giới hạn số bản ghi trong hàng đợi để không tràn bộ nhớ khi sink lỗi lâu
+        self.max_pending = max_pending
+        self._on_drop = on_drop
+        self.dropped = 0
+        self._overflowing = False
+        self._buffer: List[Dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def pending(self) -> int:
+        """Số bản ghi đang chờ ghi"""
+        return len(self._buffer)
+
+    def submit(self, record: Dict) -> bool:
+        """Đưa một bản ghi vào hàng đợi (không chờ DB); False nếu hàng đợi đầy và bản ghi bị bỏ"""
+        if len(self._buffer) >= self.max_pending:
+            if not self._overflowing:
+                print(f"Hàng đợi điểm danh đầy ({self.max_pending} bản ghi), bỏ các bản ghi mới đến khi ghi được")
+                self._overflowing = True
+            self._drop([record])
+            return False
+        self._buffer.append(record)
+        if len(self._buffer) >= self.max_batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def _drop(self, records: List[Dict]):
+        self.dropped += len(records)
+        if self._on_drop is not None:
+            try:
+                self._on_drop(records)
+            except Exception as e:
+                print(f"Lỗi xử lý bản ghi điểm danh bị bỏ: {e}")
+
+    async def start(self):
+        """Khởi động tác vụ xả lô chạy nền"""
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Dừng tác vụ nền và ghi nốt các bản ghi còn lại"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Ghi toàn bộ bản ghi đang chờ xuống DB"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.max_batch_size]
+                del self._buffer[:len(batch)]
+                try:
+                    await self._sink(batch)
+                except Exception as e:
+                    print(f"Lỗi ghi lô điểm danh ({len(batch)} bản ghi): {e}")
+                    # Trả lô về đầu hàng đợi để thử lại ở lần xả sau
+                    room = max(self.max_pending - len(self._buffer), 0)
+                    self._buffer[:0] = batch[:room]
+                    if len(batch) > room:
+                        print(f"Bỏ {len(batch) - room} bản ghi điểm danh do hàng đợi đầy")
+                        self._drop(batch[room:])
+                    return
+                self._overflowing = False
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+def session_of(timestamp: datetime) -> str:
+    """Ca học theo giờ trong ngày (khớp ENUM session của bảng attendance)"""
+    if timestamp.hour < 12:
+        return 'morning'
+    if timestamp.hour < 18:
+        return 'afternoon'
+    return 'evening'
+
+
+class AttendanceDeduplicator:
+    """Chặn ghi lặp điểm danh: mỗi (học sinh, lớp, ngày, ca) chỉ ghi một lần.
+
+    Dùng TTLCache có giới hạn kích thước (LRU) nên bộ nhớ không tăng mãi;
+    ràng buộc UNIQUE trong DB là lớp chặn cuối khi cache đã quên một key
+    (bị đẩy ra, hết hạn, hoặc sau khi khởi động lại).
+    """
+
+    def __init__(self, maxsize: int = 50000, ttl: float = 6 * 3600):
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def should_record(self, student_id, class_id, timestamp: datetime = None) -> bool:
+        """True nếu đây là lần đầu học sinh được điểm danh trong ca này"""
+        timestamp = timestamp or datetime.now()
+        key = (str(student_id), str(class_id), timestamp.date().isoformat(), session_of(timestamp))
+        return self._seen.add(key)
+
+    def forget(self, student_id, class_id, day: str, session: str):
+        """Quên một (học sinh, lớp, ngày, ca) đã ghi nhận, vd. khi bản ghi bị bỏ trước khi ghi được"""
+        self._seen.delete((str(student_id), str(class_id), day, session))
+
+    def stats(self) -> Dict:
+        """Thống kê: hits = số lần ghi lặp đã bị chặn"""
+        return self._seen.stats()
@@ -0,0 +1,103 @@
+"""
+Gom các lần đọc theo khóa trong một request thành một truy vấn WHERE id IN (...)
+cho mỗi loại dữ liệu, thay vì một query cho mỗi dòng (N+1 query).
+
+    students = BatchLoader(ClassesRepository.get_students_by_class_ids, default=list)
+    students.want(*[c['class_id'] for c in classes])   # chỉ ghi nhận khóa
+    for c in classes:
+        c['students'] = students.load(c['class_id'])    # lần load đầu chạy 1 query cho mọi khóa
+
+- query_in: chạy query có '{keys}' cho danh sách khóa, chia lô DB_IN_BATCH_SIZE khóa
+- index_by / group_by: chuyển kết quả thành dict theo khóa
+"""
+
+import os
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Sequence
+
+from service.db_connection import db
+
+# Số khóa tối đa trong một mệnh đề IN (...)
+DB_IN_BATCH_SIZE = int(os.getenv("DB_IN_BATCH_SIZE", "1000"))
+
+
+def _padded_size(n: int) -> int:
+    """Làm tròn lên lũy thừa của 2 để số câu query khác nhau (và prepared statement) có giới hạn"""
+    size = 1
+    while size < n:
+        size *= 2
+    return min(size, DB_IN_BATCH_SIZE)
+
+
+def query_in(query: str, keys: Iterable[Hashable], params: Sequence = ()) -> List[Dict]:
+    """Chạy query có chỗ '{keys}' (vd. WHERE class_id IN ({keys})) cho các khóa, chia thành nhiều lô nếu cần
+
+    Tham số của các khóa đứng trước params trong câu query. Khóa trùng được bỏ;
+    lô được đệm bằng khóa cuối để độ dài IN chỉ nhận vài giá trị cố định.
+    """
+    keys = list(dict.fromkeys(keys))
+    rows: List[Dict] = []
+    for i in range(0, len(keys), DB_IN_BATCH_SIZE):
+        chunk = keys[i:i + DB_IN_BATCH_SIZE]
+        chunk += [chunk[-1]] * (_padded_size(len(chunk)) - len(chunk))
+        placeholders = ", ".join(["%s"] * len(chunk))
+        rows.extend(db.execute_query(query.format(keys=placeholders), tuple(chunk) + tuple(params)))
+    return rows
+
+
+def index_by(rows: List[Dict], field: str) -> Dict[Hashable, Dict]:
+    """{row[field]: row}"""
+    return {row[field]: row for row in rows}
+
+
+def group_by(rows: List[Dict], field: str) -> Dict[Hashable, List[Dict]]:
+    """{row[field]: [các row có cùng giá trị]}, giữ nguyên thứ tự của query"""
+    groups: Dict[Hashable, List[Dict]] = {}
+    for row in rows:
+        groups.setdefault(row[field], []).append(row)
+    return groups
+
+
+class BatchLoader:
+    """Gom khóa rồi tải một lần bằng fetch(keys) -> {khóa: giá trị}; kết quả được nhớ trong vòng đời loader
+
+    Mỗi request tạo loader riêng (không chia sẻ giữa các request) nên không cần invalidate.
+    default tạo giá trị cho khóa không có trong kết quả (vd. list cho "không có học sinh").
+    """
+
+    def __init__(self, fetch: Callable[[List[Hashable]], Dict[Hashable, Any]], default: Callable[[], Any] = lambda: None):
+        self._fetch = fetch
+        self._default = default
+        self._pending: Dict[Hashable, None] = {}
+        self._results: Dict[Hashable, Any] = {}
+        self.batches = 0
+
+    def want(self, *keys: Hashable) -> "BatchLoader":
+        """Ghi nhận khóa sẽ cần, chưa truy vấn"""
+        for key in keys:
+            if key not in self._results:
+                self._pending[key] = None
+        return self
+
+    def dispatch(self):
+        """Tải mọi khóa đang chờ bằng một lần gọi fetch"""
+        if not self._pending:
+            return
+        keys = list(self._pending)
+        self._pending.clear()
+        found = self._fetch(keys)
+        self.batches += 1
+        for key in keys:
+            self._results[key] = found[key] if key in found else self._default()
+
+    def load(self, key: Hashable) -> Any:
+        """Giá trị của một khóa (tải cùng mọi khóa đang chờ nếu chưa có)"""
+        self.want(key)
+        self.dispatch()
+        return self._results[key]
+
+    def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        """Giá trị của nhiều khóa theo đúng thứ tự, tối đa một lần fetch"""
+        keys = list(keys)
+        self.want(*keys)
+        self.dispatch()
+        return [self._results[key] for key in keys]
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+import cv2
+import numpy as np
+
+# Mẫu URL khi cột cameras.ip_address chỉ chứa địa chỉ IP
+CAMERA_RTSP_TEMPLATE = os.getenv("CAMERA_RTSP_TEMPLATE", "rtsp://{ip}:554/stream")
+
+FrameHandler = Callable[[np.ndarray], Optional[Future]]
+
+
+def camera_source(camera: Dict) -> Optional[str]:
+    """Lấy nguồn video của một camera trong bảng cameras (URL đầy đủ, file video hoặc IP)"""
+    address = (camera.get('ip_address') or '').strip()
+    if not address:
+        return None
+    if "://" in address or os.path.exists(address):
+        return address
+    return CAMERA_RTSP_TEMPLATE.format(ip=address)
+
+
+class CameraStreamWorker:
+    """Đọc khung hình từ một camera (RTSP hoặc file video) trong thread riêng.
+
+    Luồng camera được đọc liên tục để bộ đệm luôn là khung mới nhất; cứ mỗi
+    1/fps giây một khung được lấy mẫu và đưa cho on_frame. Nếu khung trước
+    vẫn đang xử lý (Future chưa xong) thì khung mới bị bỏ qua thay vì xếp hàng.
+    Lỗi khi xử lý khung được ghi log và đếm vào frames_failed.
+    """
+
+    def __init__(
+        self,
+        camera_id: str,
+        source: str,
+        on_frame: FrameHandler,
+        fps: float = 2.0,
+        reconnect_delay: float = 5.0,
+        loop_file: bool = False
+    ):
+        self.camera_id = camera_id
+        self.source = source
+        self.fps = fps
+        self.reconnect_delay = reconnect_delay
+        self.loop_file = loop_file
+        self.is_file = os.path.exists(source)
+        self._on_frame = on_frame
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._in_flight: Optional[Future] = None
+
+        self.frames_read = 0
+        self.frames_sampled = 0
+        self.frames_dropped = 0
+        self.frames_failed = 0
+        self.last_frame_error: Optional[str] = None
+        self.connected = False
+        self.error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Bắt đầu thread đọc camera"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"camera-{self.camera_id}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng thread đọc camera"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _open(self) -> Optional[cv2.VideoCapture]:
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            capture.release()
+            return None
+        # Giữ bộ đệm nhỏ để không đọc phải khung cũ
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return capture
+
+    def _run(self):
+        interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        while not self._stop.is_set():
+            capture = self._open()
+            if capture is None:
+                self.connected = False
+                self.error = f"Không mở được nguồn {self.source}"
+                self._stop.wait(self.reconnect_delay)
+                continue
+
+            self.connected = True
+            self.error = None
+            # File video được đọc theo đúng tốc độ ghi hình để mô phỏng camera thật
+            file_frame_time = 0.0
+            if self.is_file:
+                native_fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+                file_frame_time = 1.0 / native_fps
+            next_sample = time.monotonic()
+
+            while not self._stop.is_set():
+                if not capture.grab():
+                    break
+                self.frames_read += 1
+                if file_frame_time:
+                    time.sleep(file_frame_time)
+
+                now = time.monotonic()
+                if now < next_sample:
+                    continue
+                next_sample = now + interval
+
+                if self._in_flight is not None and not self._in_flight.done():
+                    self.frames_dropped += 1
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                self.frames_sampled += 1
+                self._in_flight = self._on_frame(frame)
+                if self._in_flight is not None:
+                    self._in_flight.add_done_callback(self._frame_done)
+
+            capture.release()
+            self.connected = False
+            if self.is_file and not self.loop_file:
+                break
+            if not self.is_file:
+                self._stop.wait(self.reconnect_delay)
+
+    def _frame_done(self, fut: Future):
+        """Kiểm tra kết quả xử lý một khung: lỗi không được để Future nuốt mất"""
+        if fut.cancelled():
+            return
+        error = fut.exception()
+        if error is None:
+            return
+        self.frames_failed += 1
+        self.last_frame_error = repr(error)
+        print(f"Lỗi xử lý khung hình camera {self.camera_id}:", error)
+
+    def stats(self) -> Dict:
+        """Thống kê worker"""
+        return {
+            "camera_id": self.camera_id,
+            "source": self.source,
+            "fps": self.fps,
+            "running": self.running,
+            "connected": self.connected,
+            "error": self.error,
+            "frames_read": self.frames_read,
+            "frames_sampled": self.frames_sampled,
+            "frames_dropped": self.frames_dropped,
+            "frames_failed": self.frames_failed,
+            "last_frame_error": self.last_frame_error
+        }
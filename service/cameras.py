@@ -1,10 +1,14 @@
 from service.db_connection import db
+from service.metrics import instrument_repository
+from service.query_cache import cached, invalidate
 from typing import List, Dict, Optional
 
+@instrument_repository
 class CamerasRepository:
     """Repository để trích xuất và quản lý dữ liệu camera"""
     
     @staticmethod
+    @cached('cameras')
     def get_all_cameras() -> List[Dict]:
         """Lấy tất cả camera"""
         query = """
@@ -19,6 +23,7 @@ class CamerasRepository:
         return db.execute_query(query)
     
     @staticmethod
+    @cached('cameras')
     def get_camera_by_id(camera_id: int) -> Optional[Dict]:
         """Lấy camera theo ID"""
         query = """
@@ -78,6 +83,7 @@ class CamerasRepository:
         """
         params = (camera_name, location, ip_address)
         _, last_id = db.execute_update(query, params)
+        invalidate('cameras')
         return last_id
     
     @staticmethod
@@ -107,6 +113,7 @@ class CamerasRepository:
         params.append(camera_id)
         query = f"UPDATE cameras SET {', '.join(updates)} WHERE camera_id = %s"
         affected_rows, _ = db.execute_update(query, tuple(params))
+        invalidate('cameras')
         return affected_rows > 0
     
     @staticmethod
@@ -114,6 +121,7 @@ class CamerasRepository:
         """Xóa camera"""
         query = "DELETE FROM cameras WHERE camera_id = %s"
         affected_rows, _ = db.execute_update(query, (camera_id,))
+        invalidate('cameras')
         return affected_rows > 0
     
     @staticmethod
@@ -124,11 +132,13 @@ class CamerasRepository:
                 c.camera_id,
                 c.camera_name,
                 c.location,
-                COUNT(a.attendance_id) as total_attendance_records
+                (
+                    SELECT CAST(COALESCE(SUM(ds.total_records), 0) AS SIGNED)
+                    FROM attendance_daily_summary ds
+                    WHERE ds.camera_id = c.camera_id
+                ) as total_attendance_records
             FROM cameras c
-            LEFT JOIN attendance a ON c.camera_id = a.camera_id
             WHERE c.camera_id = %s
-            GROUP BY c.camera_id, c.camera_name, c.location
         """
         results = db.execute_query(query, (camera_id,))
         return results[0] if results else {
@@ -1,10 +1,16 @@
 from service.db_connection import db
+from service.metrics import instrument_repository
+from service.query_cache import cached, invalidate
+from service.batch_loader import BatchLoader, group_by, index_by, query_in
+from service.attendance import AttendanceRepository, empty_statistics
 from typing import List, Dict, Optional
 
+@instrument_repository
 class ClassesRepository:
     """Repository để trích xuất và quản lý dữ liệu lớp học"""
     
     @staticmethod
+    @cached('classes')
     def get_all_classes() -> List[Dict]:
         """Lấy tất cả lớp học"""
         query = """
@@ -21,6 +27,7 @@ class ClassesRepository:
         return db.execute_query(query)
     
     @staticmethod
+    @cached('classes')
     def get_class_by_id(class_id: int) -> Optional[Dict]:
         """Lấy lớp học theo ID"""
         query = """
@@ -39,6 +46,7 @@ class ClassesRepository:
         return results[0] if results else None
     
     @staticmethod
+    @cached('classes')
     def get_classes_by_teacher(teacher_id: int) -> List[Dict]:
         """Lấy tất cả lớp học của một giáo viên"""
         query = """
@@ -72,6 +80,7 @@ class ClassesRepository:
         return db.execute_query(query, (search_pattern, search_pattern))
     
     @staticmethod
+    @cached('class_students')
     def get_class_students(class_id: int) -> List[Dict]:
         """Lấy tất cả học sinh trong một lớp"""
         query = """
@@ -89,16 +98,96 @@ class ClassesRepository:
         return db.execute_query(query, (class_id,))
     
     @staticmethod
+    def get_classes_by_ids(class_ids: List[int]) -> Dict[int, Dict]:
+        """Lấy nhiều lớp học bằng một query, trả về {class_id: lớp}"""
+        query = """
+            SELECT 
+                c.class_id,
+                c.class_name,
+                c.teacher_id,
+                t.full_name as teacher_name,
+                t.email as teacher_email,
+                t.phone as teacher_phone
+            FROM classes c
+            JOIN teachers t ON c.teacher_id = t.teacher_id
+            WHERE c.class_id IN ({keys})
+        """
+        return index_by(query_in(query, class_ids), 'class_id')
+    
+    @staticmethod
+    def get_classes_by_teacher_ids(teacher_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Lấy lớp học của nhiều giáo viên bằng một query, trả về {teacher_id: [lớp]}"""
+        query = """
+            SELECT 
+                c.class_id,
+                c.class_name,
+                c.teacher_id
+            FROM classes c
+            WHERE c.teacher_id IN ({keys})
+            ORDER BY c.class_name
+        """
+        return group_by(query_in(query, teacher_ids), 'teacher_id')
+    
+    @staticmethod
+    def get_students_by_class_ids(class_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Lấy học sinh của nhiều lớp bằng một query, trả về {class_id: [học sinh]}"""
+        query = """
+            SELECT 
+                s.student_id,
+                s.class_id,
+                s.full_name,
+                s.date_of_birth,
+                s.gender,
+                s.student_code,
+                s.avatar_url
+            FROM students s
+            WHERE s.class_id IN ({keys})
+            ORDER BY s.full_name
+        """
+        groups = group_by(query_in(query, class_ids), 'class_id')
+        for students in groups.values():
+            for student in students:
+                del student['class_id']
+        return groups
+    
+    @staticmethod
+    def get_classes_with_students(class_ids: List[int]) -> List[Dict]:
+        """Lấy nhiều lớp học kèm danh sách học sinh (2 query cho mọi lớp), bỏ qua ID không tồn tại"""
+        classes = BatchLoader(ClassesRepository.get_classes_by_ids)
+        students = BatchLoader(ClassesRepository.get_students_by_class_ids, default=list)
+        classes.want(*class_ids)
+        students.want(*class_ids)
+        results = []
+        for class_info in classes.load_many(class_ids):
+            if not class_info:
+                continue
+            class_students = students.load(class_info['class_id'])
+            results.append({**class_info, 'students': class_students, 'student_count': len(class_students)})
+        return results
+    
+    @staticmethod
+    @cached('classes', 'class_students')
     def get_class_with_students(class_id: int) -> Optional[Dict]:
         """Lấy thông tin lớp học kèm danh sách học sinh"""
-        class_info = ClassesRepository.get_class_by_id(class_id)
-        if not class_info:
-            return None
-        
-        students = ClassesRepository.get_class_students(class_id)
-        class_info['students'] = students
-        class_info['student_count'] = len(students)
-        return class_info
+        results = ClassesRepository.get_classes_with_students([class_id])
+        return results[0] if results else None
+    
+    @staticmethod
+    def get_classes_overview() -> List[Dict]:
+        """Lấy tất cả lớp học, mỗi lớp kèm danh sách học sinh và thống kê điểm danh (3 query tổng cộng)"""
+        classes = ClassesRepository.get_all_classes()
+        class_ids = [c['class_id'] for c in classes]
+        students = BatchLoader(ClassesRepository.get_students_by_class_ids, default=list).want(*class_ids)
+        statistics = BatchLoader(
+            AttendanceRepository.get_attendance_statistics_by_classes,
+            default=empty_statistics
+        ).want(*class_ids)
+        for class_info in classes:
+            class_students = students.load(class_info['class_id'])
+            class_info['students'] = class_students
+            class_info['student_count'] = len(class_students)
+            class_info['statistics'] = statistics.load(class_info['class_id'])
+        return classes
     
     @staticmethod
     def create_class(class_name: str, teacher_id: int) -> int:
@@ -109,6 +198,7 @@ class ClassesRepository:
         """
         params = (class_name, teacher_id)
         _, last_id = db.execute_update(query, params)
+        invalidate('classes')
         return last_id
     
     @staticmethod
@@ -134,6 +224,7 @@ class ClassesRepository:
         params.append(class_id)
         query = f"UPDATE classes SET {', '.join(updates)} WHERE class_id = %s"
         affected_rows, _ = db.execute_update(query, tuple(params))
+        invalidate('classes')
         return affected_rows > 0
     
     @staticmethod
@@ -141,6 +232,7 @@ class ClassesRepository:
         """Xóa lớp học"""
         query = "DELETE FROM classes WHERE class_id = %s"
         affected_rows, _ = db.execute_update(query, (class_id,))
+        invalidate('classes', 'class_students')
         return affected_rows > 0
     
     @staticmethod
@@ -1,17 +1,61 @@
 import mysql.connector
 from mysql.connector import Error
 import os
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
 from dotenv import load_dotenv
 
+from service.metrics import record_db_error
+
 # Load biến môi trường từ file .env
 load_dotenv()
 
+
+class PoolTimeoutError(Error):
+    """Hết thời gian chờ mượn kết nối từ pool (mọi kết nối đều đang bận)"""
+
+
+class _PooledConnection:
+    """Một kết nối trong pool kèm thời điểm dùng gần nhất và các prepared statement đã chuẩn bị"""
+
+    def __init__(self, connection, generation: int):
+        self.connection = connection
+        self.generation = generation
+        self.last_used = time.monotonic()
+        # query -> (cursor prepared, chuỗi query đã dùng để prepare)
+        self.statements: "OrderedDict[str, tuple]" = OrderedDict()
+
+
 class DatabaseConnection:
-    """Quản lý kết nối MySQL database"""
+    """Quản lý kết nối MySQL database qua một pool kết nối
+
+    Mỗi query mượn một kết nối riêng từ pool (mysql.connector không an toàn khi
+    nhiều thread dùng chung một kết nối) và trả lại ngay khi xong. Kết nối được
+    tạo dần đến pool_size; khi pool đầy, người mượn chờ tối đa acquire_timeout giây.
+    Kết nối để rảnh lâu hơn ping_interval giây được ping (và mở lại nếu đã mất)
+    trước khi giao cho người mượn.
     
-    def __init__(self):
-        self.connection: Optional[mysql.connector.MySQLConnection] = None
+    execute_query dùng server-side prepared statement, cache theo nội dung query
+    trên từng kết nối (LRU statement_cache_size); kết nối mở lại có cache rỗng
+    nên statement được prepare lại tự động.
+    """
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        acquire_timeout: Optional[float] = None,
+        ping_interval: Optional[float] = None
+    ):
+        self.pool_size = pool_size or int(os.getenv('DB_POOL_SIZE', '10'))
+        self.acquire_timeout = acquire_timeout if acquire_timeout is not None else float(os.getenv('DB_POOL_TIMEOUT', '5.0'))
+        self.ping_interval = ping_interval if ping_interval is not None else float(os.getenv('DB_POOL_PING_INTERVAL', '0.5'))
+        self.prepared_statements = os.getenv('DB_PREPARED_STATEMENTS', '1') == '1'
+        self.statement_cache_size = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '64'))
+        # Số dòng tối đa trong một câu INSERT nhiều dòng (insert_many)
+        self.batch_size = int(os.getenv('DB_BATCH_SIZE', '500'))
         self.config = {
             'host': os.getenv('DB_HOST', 'localhost'),
             'database': os.getenv('DB_NAME', 'ai_attendance'),
@@ -20,58 +64,345 @@ class DatabaseConnection:
             'charset': 'utf8mb4',
             'collation': 'utf8mb4_unicode_ci'
         }
-    
+        self._cond = threading.Condition()
+        self._idle: List[_PooledConnection] = []
+        # Tăng khi disconnect(): kết nối của thế hệ cũ bị đóng khi được trả về
+        self._generation = 0
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self.borrows = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.wait_seconds = 0.0
+        self.statement_hits = 0
+        self.statement_misses = 0
+
+    def _open(self):
+        return mysql.connector.connect(**self.config)
+
     def connect(self):
-        """Tạo kết nối đến database"""
+        """Tạo kết nối đầu tiên của pool (kiểm tra cấu hình database)"""
         try:
-            self.connection = mysql.connector.connect(**self.config)
-            if self.connection.is_connected():
-                print(f"Kết nối thành công đến database: {self.config['database']}")
+            connection = self._open()
+            if connection.is_connected():
+                with self._cond:
+                    self._created += 1
+                    self._idle.append(_PooledConnection(connection, self._generation))
+                    self._cond.notify()
+                print(f"Kết nối thành công đến database: {self.config['database']} (pool {self.pool_size} kết nối)")
                 return True
         except Error as e:
+            record_db_error("connect")
             print(f"Lỗi kết nối database: {e}")
             return False
-    
+
     def disconnect(self):
-        """Đóng kết nối database"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("Đã đóng kết nối database")
-    
-    def get_connection(self):
-        """Lấy connection object"""
-        if not self.connection or not self.connection.is_connected():
-            self.connect()
-        return self.connection
-    
+        """Đóng toàn bộ kết nối rảnh; kết nối đang được mượn sẽ đóng khi trả về"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._generation += 1
+            self._cond.notify_all()
+        for entry in idle:
+            self._close(entry.connection)
+        if idle:
+            print(f"Đã đóng {len(idle)} kết nối database")
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def _acquire(self, timeout: float) -> _PooledConnection:
+        """Lấy một kết nối rảnh, tạo mới nếu pool chưa đầy, hoặc chờ tối đa timeout giây"""
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._created < self.pool_size:
+                        self._created += 1
+                        entry = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(
+                            msg=f"Hết {timeout}s chờ kết nối database ({self.pool_size} kết nối đều bận)"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+            self.borrows += 1
+            self.wait_seconds += time.monotonic() - start
+            generation = self._generation
+
+        try:
+            if entry is None:
+                return _PooledConnection(self._open(), generation)
+            if time.monotonic() - entry.last_used >= self.ping_interval:
+                try:
+                    entry.connection.ping(reconnect=False)
+                except Error:
+                    # Kết nối đã bị server đóng (wait_timeout, restart...): mở kết nối mới
+                    self._close(entry.connection)
+                    entry = _PooledConnection(self._open(), generation)
+                    with self._cond:
+                        self.reconnects += 1
+            return entry
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, entry: _PooledConnection, broken: bool = False):
+        """Trả kết nối về pool (transaction dở dang được rollback), đóng nếu đã hỏng"""
+        connection = entry.connection
+        if not broken:
+            try:
+                if connection.in_transaction:
+                    connection.rollback()
+            except Error:
+                broken = True
+        with self._cond:
+            self._in_use -= 1
+            keep = not broken and entry.generation == self._generation
+            if keep:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            else:
+                self._created -= 1
+            self._cond.notify()
+        if not keep:
+            self._close(connection)
+
+    @contextmanager
+    def _borrow_entry(self, timeout: Optional[float] = None):
+        entry = self._acquire(self.acquire_timeout if timeout is None else timeout)
+        broken = False
+        try:
+            yield entry
+        except Error:
+            try:
+                broken = not entry.connection.is_connected()
+            except Error:
+                broken = True
+            raise
+        finally:
+            self._release(entry, broken)
+
+    @contextmanager
+    def borrow(self, timeout: Optional[float] = None):
+        """Mượn một kết nối trong khối with, tự trả về pool khi ra khỏi khối"""
+        with self._borrow_entry(timeout) as entry:
+            yield entry.connection
+
+    def _statement(self, entry: _PooledConnection, query: str):
+        """Lấy cursor prepared cho query trên kết nối này (prepare lần đầu, dùng lại các lần sau)
+
+        Trả về (cursor, query); phải execute đúng đối tượng query trả về vì
+        cursor chỉ bỏ qua bước prepare khi nhận lại chính chuỗi đã prepare.
+        """
+        cached = entry.statements.get(query)
+        if cached is not None:
+            entry.statements.move_to_end(query)
+            # Bộ đếm dùng chung giữa các thread: += không nguyên tử
+            with self._cond:
+                self.statement_hits += 1
+            return cached
+        with self._cond:
+            self.statement_misses += 1
+        cached = (entry.connection.cursor(prepared=True, dictionary=True), query)
+        entry.statements[query] = cached
+        while len(entry.statements) > self.statement_cache_size:
+            _, (old_cursor, _) = entry.statements.popitem(last=False)
+            self._close_cursor(old_cursor)
+        return cached
+
+    def _forget_statement(self, entry: _PooledConnection, query: str):
+        """Bỏ statement lỗi khỏi cache để lần sau prepare lại"""
+        cached = entry.statements.pop(query, None)
+        if cached is not None:
+            self._close_cursor(cached[0])
+
+    @staticmethod
+    def _close_cursor(cursor):
+        try:
+            cursor.close()
+        except Error:
+            pass
+
+    def ping(self) -> bool:
+        """Kiểm tra database còn phục vụ được (mượn được kết nối còn sống)"""
+        try:
+            with self.borrow() as connection:
+                connection.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def stats(self) -> Dict:
+        """Thống kê sử dụng pool kết nối"""
+        with self._cond:
+            return {
+                "size": self.pool_size,
+                "open": self._created,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "borrows": self.borrows,
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+                "avg_wait_ms": self.wait_seconds / self.borrows * 1000 if self.borrows else 0.0,
+                "statement_hits": self.statement_hits,
+                "statement_misses": self.statement_misses
+            }
+
     def execute_query(self, query: str, params: tuple = None):
         """Thực thi query SELECT và trả về kết quả"""
         try:
-            cursor = self.get_connection().cursor(dictionary=True)
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            cursor.close()
-            return results
+            with self._borrow_entry() as entry:
+                if not self.prepared_statements:
+                    cursor = entry.connection.cursor(dictionary=True)
+                    cursor.execute(query, params)
+                    results = cursor.fetchall()
+                    cursor.close()
+                    return results
+                cursor, prepared_query = self._statement(entry, query)
+                try:
+                    cursor.execute(prepared_query, params)
+                    return cursor.fetchall()
+                except Error:
+                    self._forget_statement(entry, query)
+                    raise
         except Error as e:
+            record_db_error("query")
             print(f"Lỗi thực thi query: {e}")
             return []
-    
-    def execute_update(self, query: str, params: tuple = None):
-        """Thực thi query INSERT/UPDATE/DELETE"""
+
+    def stream_query(self, query: str, params: tuple = None, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """Đọc kết quả SELECT theo từng lô chunk_size dòng bằng cursor không đệm (fetchmany)
+
+        Server gửi dần từng dòng nên bộ nhớ chỉ giữ một lô. Kết nối bị giữ đến khi
+        đọc hết hoặc generator bị đóng; nếu dừng giữa chừng kết nối sẽ bị đóng
+        (còn dữ liệu chưa đọc) thay vì trả về pool.
+        """
+        entry = self._acquire(self.acquire_timeout)
+        finished = False
         try:
-            cursor = self.get_connection().cursor()
+            cursor = entry.connection.cursor(dictionary=True, buffered=False)
             cursor.execute(query, params)
-            self.connection.commit()
-            affected_rows = cursor.rowcount
-            last_id = cursor.lastrowid
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
             cursor.close()
-            return affected_rows, last_id
+            finished = True
+        finally:
+            self._release(entry, broken=not finished)
+
+    def execute_update(self, query: str, params: tuple = None):
+        """Thực thi query INSERT/UPDATE/DELETE"""
+        try:
+            with self.borrow() as connection:
+                cursor = connection.cursor()
+                cursor.execute(query, params)
+                connection.commit()
+                affected_rows = cursor.rowcount
+                last_id = cursor.lastrowid
+                cursor.close()
+                return affected_rows, last_id
         except Error as e:
-            if self.connection:
-                self.connection.rollback()
+            # Transaction lỗi đã được rollback khi kết nối trả về pool
+            record_db_error("update")
             print(f"Lỗi thực thi update: {e}")
             return 0, None
 
+    def execute_transaction(self, func: Callable, default=None):
+        """Chạy func(cursor) trong một transaction: commit nếu thành công, rollback và trả về default nếu lỗi"""
+        try:
+            with self.borrow() as connection:
+                cursor = connection.cursor()
+                try:
+                    result = func(cursor)
+                    connection.commit()
+                    return result
+                except Error:
+                    connection.rollback()
+                    raise
+                finally:
+                    cursor.close()
+        except Error as e:
+            record_db_error("transaction")
+            print(f"Lỗi thực thi transaction: {e}")
+            return default
+
+    def insert_many(
+        self,
+        cursor,
+        query: str,
+        rows: List[tuple],
+        batch_size: Optional[int] = None,
+        return_ids: bool = True
+    ) -> List[Optional[int]]:
+        """INSERT nhiều dòng bằng câu VALUES nhiều bộ, mỗi câu tối đa batch_size dòng (DB_BATCH_SIZE)
+
+        Dùng trong func của execute_transaction; query có chỗ '{values}', vd.
+        "INSERT INTO t (a, b) VALUES {values}". Trả về id tự tăng của từng dòng theo
+        thứ tự: InnoDB cấp id cho một câu INSERT nhiều dòng liên tiếp theo bước
+        auto_increment_increment (khác 1 với Galera/multi-primary), nên id dòng i của
+        lô là lastrowid (id dòng đầu) + i * bước. Lô không ghi đủ số dòng thì không
+        xác định được id, cả lô trả về None. return_ids=False (vd. với
+        ON DUPLICATE KEY UPDATE, lastrowid/rowcount không tương ứng với từng dòng)
+        trả về [].
+        """
+        batch_size = batch_size or self.batch_size
+        ids: List[Optional[int]] = []
+        step = 1
+        if return_ids and rows:
+            cursor.execute("SELECT @@SESSION.auto_increment_increment")
+            step = int(cursor.fetchone()[0])
+        for i in range(0, len(rows), batch_size):
+            chunk = rows[i:i + batch_size]
+            placeholders = "(" + ", ".join(["%s"] * len(chunk[0])) + ")"
+            values = ", ".join([placeholders] * len(chunk))
+            cursor.execute(query.format(values=values), tuple(value for row in chunk for value in row))
+            if not return_ids:
+                continue
+            if cursor.rowcount == len(chunk) and cursor.lastrowid:
+                ids.extend(range(cursor.lastrowid, cursor.lastrowid + len(chunk) * step, step))
+            else:
+                ids.extend([None] * len(chunk))
+        return ids
+
+    def execute_many(self, query: str, params_list: list):
+        """Thực thi một câu INSERT/UPDATE cho nhiều bộ tham số trong một transaction"""
+        if not params_list:
+            return 0, None
+        try:
+            with self.borrow() as connection:
+                cursor = connection.cursor()
+                cursor.executemany(query, params_list)
+                connection.commit()
+                affected_rows = cursor.rowcount
+                last_id = cursor.lastrowid
+                cursor.close()
+                return affected_rows, last_id
+        except Error as e:
+            record_db_error("executemany")
+            print(f"Lỗi thực thi executemany: {e}")
+            return 0, None
+
 # Singleton instance
 db = DatabaseConnection()
-
@@ -0,0 +1,88 @@
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import cv2
+import numpy as np
+
+from service.ttl_cache import TTLCache
+
+MISS = object()
+
+
+def content_hash(img_bytes: bytes) -> str:
+    """Hash chính xác nội dung file ảnh"""
+    return hashlib.blake2b(img_bytes, digest_size=16).hexdigest()
+
+
+def perceptual_hash(img_bytes: bytes) -> Optional[int]:
+    """dHash 64 bit: ảnh gần giống nhau (nén lại, đổi metadata) cho hash gần nhau theo Hamming"""
+    # Giải mã ở 1/8 độ phân giải, ảnh xám: đủ cho dHash và rất rẻ
+    gray = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class EmbeddingCache:
+    """Cache kết quả embedding theo hash nội dung ảnh (có giới hạn kích thước và TTL).
+
+    Client gửi lại đúng ảnh cũ (retry khi mạng chập chờn, kiosk) nhận lại kết quả
+    ngay mà không phải giải mã + detection + embedding. Bật near_duplicates để
+    khớp cả ảnh gần giống (khoảng cách Hamming dHash <= max_distance) trong cùng
+    một phạm vi (near_scope) do nơi gọi chỉ định.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 300.0,
+        near_duplicates: bool = False,
+        max_distance: int = 4
+    ):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        self.near_hits = 0
+
+    async def get_or_compute(
+        self,
+        img_bytes: bytes,
+        compute: Callable[[], Awaitable[Any]],
+        near_scope: Optional[str] = None
+    ) -> Any:
+        """Trả về embeddings đã lưu cho ảnh này; nếu chưa có thì await compute() rồi lưu lại.
+
+        Kết quả None (ảnh không có mặt) cũng được lưu để lần gửi lại không phải tính nữa;
+        compute() ném lỗi thì không lưu gì. Khớp gần đúng chỉ xét các ảnh đã lưu với cùng
+        near_scope (vd. cùng một học sinh): ảnh gần giống từ nơi khác chưa chắc cùng người.
+        near_scope=None chỉ khớp chính xác.
+        """
+        key = content_hash(img_bytes)
+        entry = self._cache.get(key, MISS)
+        if entry is not MISS:
+            return entry[2]
+
+        phash = None
+        if self.near_duplicates and near_scope is not None:
+            phash = perceptual_hash(img_bytes)
+            if phash is not None:
+                for _, (other, scope, embeddings) in self._cache.items():
+                    if (
+                        scope == near_scope and other is not None
+                        and bin(phash ^ other).count("1") <= self.max_distance
+                    ):
+                        self.near_hits += 1
+                        return embeddings
+
+        embeddings = await compute()
+        self._cache.set(key, (phash, near_scope, embeddings))
+        return embeddings
+
+    def stats(self) -> Dict:
+        """Thống kê hit/miss (near_hits: số lần khớp nhờ perceptual hash)"""
+        stats = self._cache.stats()
+        stats["near_duplicates"] = self.near_duplicates
+        stats["near_hits"] = self.near_hits
+        return stats
@@ -49,6 +49,11 @@ print(f"Tổng số giáo viên: {len(all_teachers)}")
 teacher_classes = TeachersRepository.get_teacher_classes(teacher_id=1)
 print(f"Số lớp của giáo viên: {len(teacher_classes)}")
 
+# Lấy giáo viên kèm lớp và học sinh (mỗi tầng một query)
+teacher_tree = TeachersRepository.get_teacher_tree(teacher_id=1)
+if teacher_tree:
+    print(f"Giáo viên: {teacher_tree['full_name']}, Số lớp: {len(teacher_tree['classes'])}")
+
 # ===========================================================
 # Ví dụ với ClassesRepository
 # ===========================================================
@@ -62,6 +67,12 @@ class_info = ClassesRepository.get_class_with_students(class_id=1)
 if class_info:
     print(f"Lớp: {class_info['class_name']}, Số học sinh: {class_info['student_count']}")
 
+# Tổng quan tất cả lớp: học sinh và thống kê điểm danh (3 query cho mọi lớp)
+overview = ClassesRepository.get_classes_overview()
+for item in overview[:3]:
+    print(f"Lớp: {item['class_name']}, Số học sinh: {item['student_count']}, "
+          f"Có mặt: {item['statistics']['present_count']}")
+
 # ===========================================================
 # Ví dụ với FaceEmbeddingsRepository
 # ===========================================================
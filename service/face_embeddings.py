@@ -1,8 +1,46 @@
 from service.db_connection import db
+from service.metrics import instrument_repository
+from service.pagination import clamp_limit, decode_cursor, make_page
 from typing import List, Dict, Optional
-import json
+import os
+import numpy as np
 from datetime import datetime
 
+# Kiểu dữ liệu khi ghi embedding mới: float32 (mặc định) hoặc float16 (nhỏ gấp đôi)
+EMBEDDING_DTYPE = os.getenv('EMBEDDING_DTYPE', 'float32')
+
+_DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2'),
+}
+
+
+def encode_embedding(embedding, dtype: str = None) -> bytes:
+    """Chuyển embedding (list/ndarray) sang bytes để lưu vào cột BLOB"""
+    return np.asarray(embedding, dtype=_DTYPES[dtype or EMBEDDING_DTYPE]).tobytes()
+
+
+def decode_embedding(blob: bytes, dtype: str = 'float32') -> np.ndarray:
+    """Đọc embedding từ bytes trong cột BLOB, luôn trả về float32"""
+    return np.frombuffer(blob, dtype=_DTYPES[dtype]).astype(np.float32)
+
+
+def _decode_results(results: List[Dict], as_list: bool = True) -> List[Dict]:
+    """Giải mã cột embedding_vector thành khóa 'embedding' (list để trả JSON, hoặc ndarray)"""
+    for result in results:
+        blob = result.pop('embedding_vector', None)
+        if blob is None:
+            result['embedding'] = None
+            continue
+        try:
+            embedding = decode_embedding(blob, result.get('embedding_dtype') or 'float32')
+            result['embedding'] = embedding.tolist() if as_list else embedding
+        except (KeyError, ValueError):
+            result['embedding'] = None
+    return results
+
+
+@instrument_repository
 class FaceEmbeddingsRepository:
     """Repository để trích xuất và quản lý dữ liệu face embeddings"""
     
@@ -13,7 +51,8 @@ class FaceEmbeddingsRepository:
             SELECT 
                 e.embedding_id,
                 e.student_id,
-                e.embedding_json,
+                e.embedding_vector,
+                e.embedding_dtype,
                 e.image_url,
                 e.created_at,
                 s.full_name as student_name,
@@ -23,14 +62,36 @@ class FaceEmbeddingsRepository:
             ORDER BY e.created_at DESC
         """
         results = db.execute_query(query)
-        # Parse JSON embedding
-        for result in results:
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-        return results
+        return _decode_results(results)
+    
+    @staticmethod
+    def get_embeddings_page(limit: int = None, cursor: str = None) -> Dict:
+        """Lấy một trang embeddings, mới nhất trước (phân trang keyset theo created_at, embedding_id)"""
+        limit = clamp_limit(limit)
+        where = ""
+        params: tuple = ()
+        if cursor:
+            last_created, last_id = decode_cursor(cursor, 2)
+            where = "WHERE e.created_at < %s OR (e.created_at = %s AND e.embedding_id < %s)"
+            params = (last_created, last_created, last_id)
+        query = f"""
+            SELECT 
+                e.embedding_id,
+                e.student_id,
+                e.embedding_vector,
+                e.embedding_dtype,
+                e.image_url,
+                e.created_at,
+                s.full_name as student_name,
+                s.student_code
+            FROM face_embeddings e
+            JOIN students s ON e.student_id = s.student_id
+            {where}
+            ORDER BY e.created_at DESC, e.embedding_id DESC
+            LIMIT %s
+        """
+        results = db.execute_query(query, params + (limit + 1,))
+        return make_page(_decode_results(results), limit, ('created_at', 'embedding_id'))
     
     @staticmethod
     def get_embedding_by_id(embedding_id: int) -> Optional[Dict]:
@@ -39,7 +100,8 @@ class FaceEmbeddingsRepository:
             SELECT 
                 e.embedding_id,
                 e.student_id,
-                e.embedding_json,
+                e.embedding_vector,
+                e.embedding_dtype,
                 e.image_url,
                 e.created_at,
                 s.full_name as student_name,
@@ -48,16 +110,8 @@ class FaceEmbeddingsRepository:
             JOIN students s ON e.student_id = s.student_id
             WHERE e.embedding_id = %s
         """
-        results = db.execute_query(query, (embedding_id,))
-        if results:
-            result = results[0]
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-            return result
-        return None
+        results = _decode_results(db.execute_query(query, (embedding_id,)))
+        return results[0] if results else None
     
     @staticmethod
     def get_embeddings_by_student(student_id: int) -> List[Dict]:
@@ -66,7 +120,8 @@ class FaceEmbeddingsRepository:
             SELECT 
                 e.embedding_id,
                 e.student_id,
-                e.embedding_json,
+                e.embedding_vector,
+                e.embedding_dtype,
                 e.image_url,
                 e.created_at,
                 s.full_name as student_name,
@@ -77,14 +132,7 @@ class FaceEmbeddingsRepository:
             ORDER BY e.created_at DESC
         """
         results = db.execute_query(query, (student_id,))
-        # Parse JSON embedding
-        for result in results:
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-        return results
+        return _decode_results(results)
     
     @staticmethod
     def get_latest_embedding_by_student(student_id: int) -> Optional[Dict]:
@@ -93,7 +141,8 @@ class FaceEmbeddingsRepository:
             SELECT 
                 e.embedding_id,
                 e.student_id,
-                e.embedding_json,
+                e.embedding_vector,
+                e.embedding_dtype,
                 e.image_url,
                 e.created_at,
                 s.full_name as student_name,
@@ -104,16 +153,8 @@ class FaceEmbeddingsRepository:
             ORDER BY e.created_at DESC
             LIMIT 1
         """
-        results = db.execute_query(query, (student_id,))
-        if results:
-            result = results[0]
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-            return result
-        return None
+        results = _decode_results(db.execute_query(query, (student_id,)))
+        return results[0] if results else None
     
     @staticmethod
     def create_embedding(
@@ -122,15 +163,33 @@ class FaceEmbeddingsRepository:
         image_url: str = None
     ) -> int:
         """Tạo embedding mới"""
-        embedding_json = json.dumps(embedding)
         query = """
-            INSERT INTO face_embeddings (student_id, embedding_json, image_url)
-            VALUES (%s, %s, %s)
+            INSERT INTO face_embeddings (student_id, embedding_vector, embedding_dtype, image_url)
+            VALUES (%s, %s, %s, %s)
         """
-        params = (student_id, embedding_json, image_url)
+        params = (student_id, encode_embedding(embedding), EMBEDDING_DTYPE, image_url)
         _, last_id = db.execute_update(query, params)
         return last_id
     
+    @staticmethod
+    def create_embedding_many(records: List[Dict]) -> List[int]:
+        """Tạo nhiều embedding trong một transaction (INSERT nhiều dòng, mỗi câu tối đa DB_BATCH_SIZE dòng)
+        
+        Mỗi record là dict với các khóa student_id, embedding, image_url (tùy chọn).
+        Trả về ID theo thứ tự records, hoặc [] nếu lỗi (không embedding nào được tạo).
+        """
+        query = """
+            INSERT INTO face_embeddings (student_id, embedding_vector, embedding_dtype, image_url)
+            VALUES {values}
+        """
+        rows = [
+            (r['student_id'], encode_embedding(r['embedding']), EMBEDDING_DTYPE, r.get('image_url'))
+            for r in records
+        ]
+        if not rows:
+            return []
+        return db.execute_transaction(lambda cursor: db.insert_many(cursor, query, rows)) or []
+    
     @staticmethod
     def update_embedding(
         embedding_id: int,
@@ -141,10 +200,11 @@ class FaceEmbeddingsRepository:
         updates = []
         params = []
         
-        if embedding:
-            embedding_json = json.dumps(embedding)
-            updates.append("embedding_json = %s")
-            params.append(embedding_json)
+        if embedding is not None and len(embedding):
+            updates.append("embedding_vector = %s")
+            params.append(encode_embedding(embedding))
+            updates.append("embedding_dtype = %s")
+            params.append(EMBEDDING_DTYPE)
         if image_url:
             updates.append("image_url = %s")
             params.append(image_url)
@@ -165,41 +225,69 @@ class FaceEmbeddingsRepository:
         return affected_rows > 0
     
     @staticmethod
-    def get_all_embeddings_for_recognition() -> List[Dict]:
-        """Lấy tất cả embeddings để nhận diện (chỉ lấy embedding mới nhất của mỗi học sinh)"""
-        query = """
+    def get_all_embeddings_for_recognition(latest_only: bool = True) -> List[Dict]:
+        """Lấy tất cả embeddings để nhận diện
+        
+        latest_only=True chỉ lấy embedding mới nhất của mỗi học sinh; False lấy
+        toàn bộ K embedding, các dòng của cùng học sinh nằm liền nhau.
+        'embedding' trả về dạng ndarray float32 để dựng ma trận/chỉ mục trực tiếp.
+        """
+        latest_filter = """
+            WHERE e.embedding_id IN (
+                SELECT MAX(embedding_id)
+                FROM face_embeddings
+                GROUP BY student_id
+            )
+        """ if latest_only else ""
+        query = f"""
             SELECT 
+                e.embedding_id,
                 e.student_id,
-                e.embedding_json,
+                e.embedding_vector,
+                e.embedding_dtype,
                 s.full_name as student_name,
                 s.student_code,
                 s.class_id
             FROM face_embeddings e
             JOIN students s ON e.student_id = s.student_id
-            WHERE e.embedding_id IN (
-                SELECT MAX(embedding_id)
-                FROM face_embeddings
-                GROUP BY student_id
-            )
+            {latest_filter}
+            ORDER BY e.student_id, e.embedding_id
         """
         results = db.execute_query(query)
-        # Parse JSON embedding
-        for result in results:
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-        return results
+        return _decode_results(results, as_list=False)
     
     @staticmethod
-    def get_embeddings_by_class(class_id: int) -> List[Dict]:
-        """Lấy tất cả embeddings của học sinh trong một lớp"""
+    def get_embeddings_by_class(class_id: int, latest_only: bool = True) -> List[Dict]:
+        """Lấy embeddings của học sinh trong một lớp ('embedding' dạng ndarray float32)
+        
+        latest_only=False trả về toàn bộ K embedding của mỗi học sinh (liền nhau theo học sinh).
+        """
+        if not latest_only:
+            query = """
+                SELECT 
+                    e.embedding_id,
+                    e.student_id,
+                    e.embedding_vector,
+                    e.embedding_dtype,
+                    e.image_url,
+                    e.created_at,
+                    s.full_name as student_name,
+                    s.student_code,
+                    s.class_id
+                FROM face_embeddings e
+                JOIN students s ON e.student_id = s.student_id
+                WHERE s.class_id = %s
+                ORDER BY s.full_name, e.student_id, e.embedding_id
+            """
+            results = db.execute_query(query, (class_id,))
+            return _decode_results(results, as_list=False)
+
         query = """
             SELECT 
                 e.embedding_id,
                 e.student_id,
-                e.embedding_json,
+                e.embedding_vector,
+                e.embedding_dtype,
                 e.image_url,
                 e.created_at,
                 s.full_name as student_name,
@@ -218,12 +306,5 @@ class FaceEmbeddingsRepository:
             ORDER BY s.full_name
         """
         results = db.execute_query(query, (class_id, class_id))
-        # Parse JSON embedding
-        for result in results:
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-        return results
+        return _decode_results(results, as_list=False)
 
@@ -0,0 +1,200 @@
+import asyncio
+import numpy as np
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Chuẩn hóa L2 từng hàng, trả về ma trận float32"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ClassGallery:
+    """Ma trận embedding đã chuẩn hóa (float32) của một lớp kèm mảng id/tên học sinh.
+
+    Mỗi học sinh có thể có K embedding (nhiều ảnh đăng ký). Các hàng của
+    matrix được xếp liền nhau theo học sinh, starts[i] là hàng đầu tiên của
+    học sinh i, nên điểm của học sinh = max trên K hàng của mình
+    (np.maximum.reduceat, không có vòng lặp Python).
+    Với reduce="mean" mỗi học sinh chỉ giữ một prototype (trung bình đã chuẩn hóa).
+    """
+
+    def __init__(self, student_ids: Sequence[str], names: Sequence[str], embeddings, reduce: str = "max"):
+        if reduce not in ("max", "mean"):
+            raise ValueError("reduce phải là 'max' hoặc 'mean'")
+        self.reduce = reduce
+        self.student_ids = np.asarray(student_ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        groups = [self._prepare(e) for e in embeddings]
+        if groups:
+            self.matrix = np.vstack(groups)
+            counts = np.array([len(g) for g in groups], dtype=np.int64)
+            self.starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        else:
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+            self.starts = np.empty(0, dtype=np.int64)
+
+    def _prepare(self, embeddings) -> np.ndarray:
+        """Chuẩn hóa K embedding của một học sinh (K x D), hoặc gộp thành 1 prototype nếu reduce='mean'"""
+        rows = normalize_rows(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        if self.reduce == "mean" and len(rows) > 1:
+            rows = normalize_rows(rows.mean(axis=0))
+        return rows
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    @property
+    def embedding_count(self) -> int:
+        return len(self.matrix)
+
+    def add(self, student_id: str, name: str, embedding):
+        """Thêm một học sinh (một hoặc K embedding) vào gallery (không cần đọc lại DB)"""
+        rows = self._prepare(embedding)
+        if len(self) == 0:
+            self.matrix = rows
+        else:
+            self.matrix = np.vstack([self.matrix, rows])
+        self.starts = np.append(self.starts, self.embedding_count - len(rows))
+        self.student_ids = np.append(self.student_ids, np.asarray([student_id], dtype=object))
+        self.names = np.append(self.names, np.asarray([name], dtype=object))
+
+    def add_embedding(self, student_id: str, embedding) -> bool:
+        """Thêm embedding cho học sinh đã có trong gallery; False nếu không tìm thấy học sinh"""
+        found = np.flatnonzero(self.student_ids == student_id)
+        if not len(found):
+            return False
+        i = int(found[0])
+        end = int(self.starts[i + 1]) if i + 1 < len(self) else self.embedding_count
+        if self.reduce == "mean":
+            # Cập nhật lại prototype: coi prototype hiện tại như một mẫu
+            prototype = self._prepare(np.vstack([self.matrix[self.starts[i]:end], normalize_rows(embedding)]))
+            self.matrix[self.starts[i]:end] = prototype
+            return True
+        self.matrix = np.insert(self.matrix, end, normalize_rows(embedding), axis=0)
+        self.starts[i + 1:] += 1
+        return True
+
+    def _reduce(self, row_scores: np.ndarray) -> np.ndarray:
+        """Gộp điểm theo hàng (..., R) thành điểm theo học sinh (..., S) bằng max trên K hàng"""
+        if self.embedding_count == len(self):
+            return row_scores
+        return np.maximum.reduceat(row_scores, self.starts, axis=-1)
+
+    def scores(self, embedding) -> np.ndarray:
+        """Cosine similarity giữa một embedding và toàn bộ học sinh (một phép nhân ma trận-vector)"""
+        if len(self) == 0:
+            return np.empty(0, dtype=np.float32)
+        query = normalize_rows(embedding)[0]
+        return self._reduce(self.matrix @ query)
+
+    def match(self, embedding, threshold: float) -> List[Dict]:
+        """Trả về các học sinh có điểm >= threshold"""
+        scores = self.scores(embedding)
+        return [
+            {
+                "student_id": self.student_ids[i],
+                "name": self.names[i],
+                "score": float(scores[i])
+            }
+            for i in np.flatnonzero(scores >= threshold)
+        ]
+
+    def match_many(self, embeddings, threshold: float) -> List[Dict]:
+        """Đối chiếu nhiều khuôn mặt cùng lúc bằng một phép nhân ma trận (faces x students).
+
+        Mỗi học sinh được gán cho tối đa một khuôn mặt và ngược lại:
+        các cặp được xét theo điểm giảm dần (gán tham lam).
+        """
+        if len(self) == 0 or len(embeddings) == 0:
+            return []
+        scores = self._reduce(normalize_rows(embeddings) @ self.matrix.T)
+
+        face_idx, student_idx = np.nonzero(scores >= threshold)
+        order = np.argsort(-scores[face_idx, student_idx], kind="stable")
+
+        used_faces, used_students = set(), set()
+        results = []
+        for k in order:
+            f, s = int(face_idx[k]), int(student_idx[k])
+            if f in used_faces or s in used_students:
+                continue
+            used_faces.add(f)
+            used_students.add(s)
+            results.append({
+                "face_index": f,
+                "student_id": self.student_ids[s],
+                "name": self.names[s],
+                "score": float(scores[f, s])
+            })
+        return results
+
+
+# loader(class_id) -> (student_ids, names, embeddings); embeddings[i] là 1 vector hoặc K vector
+GalleryLoader = Callable[[str], Awaitable[Tuple[List[str], List[str], list]]]
+
+
+class FaceGallery:
+    """Cache gallery theo lớp, nạp lười ở request đầu tiên của mỗi lớp"""
+
+    def __init__(self, loader: GalleryLoader, reduce: str = "max"):
+        self._loader = loader
+        self.reduce = reduce
+        self._galleries: Dict[str, ClassGallery] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Tăng mỗi khi lớp bị invalidate để bỏ kết quả của lần nạp đang chạy dở
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, class_id: str) -> ClassGallery:
+        """Lấy gallery của lớp, nạp từ DB nếu chưa có"""
+        gallery = self._galleries.get(class_id)
+        if gallery is not None:
+            return gallery
+
+        lock = self._locks.setdefault(class_id, asyncio.Lock())
+        async with lock:
+            gallery = self._galleries.get(class_id)
+            if gallery is not None:
+                return gallery
+
+            generation = self._generations.get(class_id, 0)
+            student_ids, names, embeddings = await self._loader(class_id)
+            gallery = ClassGallery(student_ids, names, embeddings, reduce=self.reduce)
+            if self._generations.get(class_id, 0) == generation:
+                self._galleries[class_id] = gallery
+            return gallery
+
+    def add_student(self, class_id: str, student_id: str, name: str, embedding: List[float]):
+        """Cập nhật gallery khi có học sinh mới được thêm embedding"""
+        gallery = self._galleries.get(class_id)
+        if gallery is not None:
+            gallery.add(student_id, name, embedding)
+        else:
+            self.invalidate(class_id)
+
+    def add_embedding(self, class_id: str, student_id: str, embedding: List[float]):
+        """Cập nhật gallery khi học sinh đã có được thêm ảnh đăng ký"""
+        gallery = self._galleries.get(class_id)
+        if gallery is None or not gallery.add_embedding(student_id, embedding):
+            self.invalidate(class_id)
+
+    def invalidate(self, class_id: Optional[str] = None):
+        """Xóa cache của một lớp (hoặc tất cả nếu class_id là None)"""
+        class_ids = set(self._galleries) | set(self._locks) if class_id is None else [class_id]
+        for cid in class_ids:
+            self._galleries.pop(cid, None)
+            self._generations[cid] = self._generations.get(cid, 0) + 1
+
+    async def match(self, class_id: str, embedding, threshold: float) -> List[Dict]:
+        """Đối chiếu embedding với gallery của lớp"""
+        gallery = await self.get(class_id)
+        return gallery.match(embedding, threshold)
+
+    async def match_many(self, class_id: str, embeddings, threshold: float) -> List[Dict]:
+        """Đối chiếu tất cả khuôn mặt của một khung hình với gallery của lớp"""
+        gallery = await self.get(class_id)
+        return gallery.match_many(embeddings, threshold)
@@ -0,0 +1,132 @@
+import itertools
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU giữa hai tập box (x1, y1, x2, y2), trả về ma trận len(a) x len(b)"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    """Một khuôn mặt được theo dõi qua nhiều khung hình"""
+
+    def __init__(self, track_id: int, bbox: np.ndarray):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.hits = 1
+        self.missed = 0
+        self.student_id: Optional[str] = None
+        self.name: Optional[str] = None
+        self.score = 0.0
+        self.embedded_at: Optional[float] = None
+
+    @property
+    def identified(self) -> bool:
+        return self.student_id is not None
+
+
+class FaceTracker:
+    """Tracker IoU đơn giản gán track ID cố định cho các detection qua các khung hình.
+
+    Embedding + đối chiếu gallery chỉ chạy khi track mới xuất hiện; track chưa
+    nhận diện được (hoặc điểm thấp hơn min_confidence) được thử lại sau
+    retry_interval giây, track đã nhận diện chắc chắn thì không embedding lại.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_missed: int = 10,
+        retry_interval: float = 2.0,
+        min_confidence: float = 0.75
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.retry_interval = retry_interval
+        self.min_confidence = min_confidence
+        self.tracks: Dict[int, Track] = {}
+        self._ids = itertools.count(1)
+
+        self.detections = 0
+        self.embeddings = 0
+
+    def update(self, bboxes) -> List[Track]:
+        """Ghép detection của khung hình mới với các track hiện có, trả về track tương ứng từng detection"""
+        bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        self.detections += len(bboxes)
+        tracks = list(self.tracks.values())
+        assigned: List[Optional[Track]] = [None] * len(bboxes)
+
+        if tracks and len(bboxes):
+            ious = iou_matrix([t.bbox for t in tracks], bboxes)
+            # Ghép tham lam theo IoU giảm dần
+            pairs = np.argwhere(ious >= self.iou_threshold)
+            order = np.argsort(-ious[pairs[:, 0], pairs[:, 1]], kind="stable")
+            used_tracks = set()
+            for t_idx, d_idx in pairs[order]:
+                if t_idx in used_tracks or assigned[d_idx] is not None:
+                    continue
+                used_tracks.add(t_idx)
+                track = tracks[t_idx]
+                track.bbox = bboxes[d_idx]
+                track.hits += 1
+                track.missed = 0
+                assigned[d_idx] = track
+
+        matched_ids = {t.track_id for t in assigned if t is not None}
+        for track in tracks:
+            if track.track_id not in matched_ids:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[track.track_id]
+
+        for d_idx, track in enumerate(assigned):
+            if track is None:
+                track = Track(next(self._ids), bboxes[d_idx])
+                self.tracks[track.track_id] = track
+                assigned[d_idx] = track
+        return assigned
+
+    def needs_embedding(self, track: Track, now: Optional[float] = None) -> bool:
+        """Track có cần chạy embedding + đối chiếu gallery ở khung hình này không"""
+        if track.embedded_at is None:
+            return True
+        if track.identified and track.score >= self.min_confidence:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - track.embedded_at >= self.retry_interval
+
+    def mark_embedded(self, track: Track, now: Optional[float] = None):
+        """Ghi nhận track vừa được embedding"""
+        track.embedded_at = time.monotonic() if now is None else now
+        self.embeddings += 1
+
+    def assign(self, track: Track, student_id: Optional[str], name: Optional[str], score: float):
+        """Lưu kết quả đối chiếu gallery cho track (giữ kết quả tốt nhất)"""
+        if student_id is None:
+            return
+        if not track.identified or score >= track.score:
+            track.student_id = student_id
+            track.name = name
+            track.score = score
+
+    def stats(self) -> Dict:
+        """Thống kê: số detection, số lần embedding thực sự chạy, số track đang theo dõi"""
+        return {
+            "active_tracks": len(self.tracks),
+            "detections": self.detections,
+            "embeddings": self.embeddings
+        }
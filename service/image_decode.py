@@ -0,0 +1,51 @@
+import io
+from typing import Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Cờ giải mã thu nhỏ của OpenCV (với JPEG, libjpeg giải mã thẳng ở độ phân giải 1/2, 1/4, 1/8)
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def _reduce_flag(img_bytes: bytes, min_side: Optional[int]) -> int:
+    """Chọn mức thu nhỏ lớn nhất mà cạnh dài của ảnh vẫn >= min_side"""
+    if not min_side:
+        return cv2.IMREAD_COLOR
+    try:
+        # Image.open chỉ đọc header, chưa giải mã pixel
+        width, height = Image.open(io.BytesIO(img_bytes)).size
+    except Exception:
+        return cv2.IMREAD_COLOR
+    long_side = max(width, height)
+    for factor, flag in _REDUCED_FLAGS:
+        if long_side // factor >= min_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image_bgr(img_bytes: bytes, min_side: Optional[int] = None) -> Optional[np.ndarray]:
+    """Giải mã bytes ảnh thẳng sang mảng BGR (định dạng InsightFace/OpenCV dùng).
+
+    Nếu có min_side, ảnh lớn (vd. ảnh điện thoại 12 MP) được thu nhỏ ngay lúc giải mã
+    nhưng cạnh dài vẫn không nhỏ hơn min_side (thường là cạnh của det_size).
+    """
+    buffer = np.frombuffer(img_bytes, dtype=np.uint8)
+    img_bgr = cv2.imdecode(buffer, _reduce_flag(img_bytes, min_side))
+    if img_bgr is not None:
+        return img_bgr
+
+    # Định dạng OpenCV không đọc được: quay về PIL
+    try:
+        img = Image.open(io.BytesIO(img_bytes))
+        if min_side:
+            img.draft("RGB", (min_side, min_side))
+        return cv2.cvtColor(np.asarray(img.convert("RGB")), cv2.COLOR_RGB2BGR)
+    except Exception as e:
+        print("Lỗi decode_image_bgr:", e)
+        return None
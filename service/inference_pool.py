@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def _set_intra_op_threads(model, intra_op_threads: int):
+    """Tạo lại các phiên ONNX Runtime của FaceAnalysis với số luồng intra-op cố định.
+
+    InsightFace không cho truyền SessionOptions khi khởi tạo, nên mỗi session
+    được mở lại từ cùng file .onnx với cấu hình mới.
+    """
+    import onnxruntime
+
+    for sub_model in model.models.values():
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        sub_model.session = onnxruntime.InferenceSession(
+            sub_model.model_file,
+            sess_options=options,
+            providers=sub_model.session.get_providers()
+        )
+
+
+def _warm_up(model):
+    """Chạy thử một lần detection và recognition để ONNX Runtime cấp phát bộ nhớ trước"""
+    height, width = model.det_size[1], model.det_size[0]
+    model.get(np.zeros((height, width, 3), dtype=np.uint8))
+    recognition = model.models.get("recognition")
+    if recognition is not None:
+        recognition.get_feat(np.zeros((112, 112, 3), dtype=np.uint8))
+
+
+class FaceModelPool:
+    """Pool gồm N phiên bản InsightFace FaceAnalysis chạy song song trong thread.
+
+    Mỗi lời gọi run() lấy một model đang rảnh (chờ nếu tất cả đều bận), nên các
+    request đồng thời không tranh nhau một phiên ONNX Runtime duy nhất.
+    load() có thể chạy ở nền; is_ready cho biết pool đã sẵn sàng nhận request.
+    """
+
+    def __init__(
+        self,
+        size: Optional[int] = None,
+        model_name: str = "buffalo_l",
+        det_size: Tuple[int, int] = (640, 640),
+        ctx_id: int = -1,
+        intra_op_threads: Optional[int] = None
+    ):
+        cpu_count = os.cpu_count() or 1
+        if size is None:
+            # Mặc định chia đều số core: mỗi model dùng intra_op_threads luồng
+            size = max(1, cpu_count // (intra_op_threads or 2))
+        if intra_op_threads is None:
+            intra_op_threads = max(1, cpu_count // size)
+
+        self.size = size
+        self.model_name = model_name
+        self.det_size = det_size
+        self.ctx_id = ctx_id
+        self.intra_op_threads = intra_op_threads
+
+        self._free: "queue.Queue" = queue.Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._busy = 0
+        self._completed = 0
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._executor is not None
+
+    def _create_model(self):
+        """Khởi tạo và prepare() một phiên bản FaceAnalysis"""
+        import insightface
+
+        model = insightface.app.FaceAnalysis(name=self.model_name)
+        model.prepare(ctx_id=self.ctx_id, det_size=self.det_size)
+        if self.ctx_id < 0:
+            _set_intra_op_threads(model, self.intra_op_threads)
+        _warm_up(model)
+        return model
+
+    def load(self) -> bool:
+        """Nạp và warm-up đủ size model vào pool (chạy được trong thread nền)"""
+        start = time.perf_counter()
+        try:
+            for _ in range(self.size):
+                self._free.put(self._create_model())
+        except Exception as e:
+            self.error = str(e)
+            print(f"Lỗi nạp model {self.model_name}: {e}")
+            return False
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="face-model")
+        self.load_seconds = time.perf_counter() - start
+        print(f"Đã nạp {self.size} model {self.model_name} ({self.intra_op_threads} luồng/model) "
+              f"trong {self.load_seconds:.1f}s")
+        return True
+
+    def shutdown(self):
+        """Dừng thread pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _call(self, func: Callable, args: tuple):
+        model = self._free.get()
+        with self._lock:
+            self._busy += 1
+        try:
+            return func(model, *args)
+        finally:
+            self._free.put(model)
+            with self._lock:
+                self._busy -= 1
+                self._pending -= 1
+                self._completed += 1
+
+    async def run(self, func: Callable, *args):
+        """Chạy func(model, *args) trên một model đang rảnh"""
+        if self._executor is None:
+            raise RuntimeError("FaceModelPool chưa được nạp (gọi load() trước)")
+        with self._lock:
+            self._pending += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    def stats(self) -> Dict:
+        """Thống kê pool: số model, số đang bận, độ dài hàng đợi"""
+        with self._lock:
+            return {
+                "ready": self.is_ready,
+                "error": self.error,
+                "load_seconds": self.load_seconds,
+                "model_name": self.model_name,
+                "size": self.size,
+                "intra_op_threads": self.intra_op_threads,
+                "busy": self._busy,
+                "queue_depth": self._pending - self._busy,
+                "completed": self._completed
+            }
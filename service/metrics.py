@@ -0,0 +1,278 @@
+"""
+Metrics dạng Prometheus (text exposition format) viết tay, không cần thư viện ngoài.
+
+- Counter / Histogram / Gauge có nhãn, an toàn đa luồng
+- instrument_repository: decorator lớp đo thời gian mọi phương thức của Repository
+  và ghi log query chậm (SLOW_QUERY_MS); outcome="error" khi có ngoại lệ hoặc
+  DatabaseConnection đã bắt lỗi (record_db_error) trong lúc gọi
+- install_http_metrics: middleware đếm request và đo độ trễ theo route
+- render(): nội dung cho endpoint /metrics
+"""
+
+import functools
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Ngưỡng (ms) để in log query chậm; 0 để tắt
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Bộ đếm chỉ tăng"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Giá trị tức thời; có thể đặt trực tiếp hoặc đọc từ callback lúc render"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], object]] = None
+    ):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        # callback trả về một số (gauge không nhãn) hoặc dict {tuple nhãn: số}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                result = self._callback()
+            except Exception as e:
+                print(f"Lỗi đọc gauge {self.name}: {e}")
+                return []
+            items = sorted(result.items()) if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+            for k, v in items if v is not None
+        ]
+
+
+class Histogram(_Metric):
+    """Phân bố giá trị (độ trễ) theo các bucket cố định"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [đếm theo bucket..., tổng, số lần]
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        names = self.labelnames + ("le",)
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Tập hợp các metric của tiến trình"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+REPOSITORY_CALLS = REGISTRY.counter(
+    "repository_calls_total", "Số lần gọi phương thức Repository", ("repository", "method", "outcome")
+)
+REPOSITORY_LATENCY = REGISTRY.histogram(
+    "repository_call_duration_seconds", "Thời gian thực thi phương thức Repository", ("repository", "method")
+)
+SLOW_QUERIES = REGISTRY.counter(
+    "repository_slow_calls_total", "Số lần gọi Repository chậm hơn SLOW_QUERY_MS", ("repository", "method")
+)
+DB_ERRORS = REGISTRY.counter(
+    "db_errors_total", "Số lỗi MySQL theo loại thao tác", ("operation",)
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Số HTTP request", ("app", "method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Thời gian xử lý HTTP request", ("app", "method", "route")
+)
+
+
+# Số lỗi DB đã bị DatabaseConnection bắt (và trả về giá trị mặc định) trên thread hiện tại
+_db_errors = threading.local()
+
+
+def record_db_error(operation: str):
+    """Đếm một lỗi MySQL; lời gọi Repository đang chạy trên thread này sẽ có outcome="error"."""
+    DB_ERRORS.inc(operation=operation)
+    _db_errors.count = getattr(_db_errors, "count", 0) + 1
+
+
+def render() -> str:
+    """Nội dung /metrics"""
+    return REGISTRY.render()
+
+
+def _timed(repository: str, method: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        errors_before = getattr(_db_errors, "count", 0)
+        outcome = "error"
+        try:
+            result = func(*args, **kwargs)
+            # execute_query/execute_update nuốt lỗi và trả về []/(0, None): dựa vào số lỗi đã ghi
+            if getattr(_db_errors, "count", 0) == errors_before:
+                outcome = "ok"
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            REPOSITORY_CALLS.inc(repository=repository, method=method, outcome=outcome)
+            REPOSITORY_LATENCY.observe(elapsed, repository=repository, method=method)
+            if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+                SLOW_QUERIES.inc(repository=repository, method=method)
+                print(f"Query chậm: {repository}.{method} {elapsed * 1000:.1f} ms")
+
+    return wrapper
+
+
+def instrument_repository(cls):
+    """Decorator lớp: đo thời gian mọi staticmethod công khai của Repository"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or not isinstance(attr, staticmethod):
+            continue
+        setattr(cls, name, staticmethod(_timed(cls.__name__, name, attr.__func__)))
+    return cls
+
+
+def install_http_metrics(app, app_name: str):
+    """Thêm middleware đếm request và đo độ trễ theo route (dùng mẫu route để tránh bùng nổ nhãn)"""
+
+    @app.middleware("http")
+    async def http_metrics(request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            elapsed = time.perf_counter() - start
+            HTTP_REQUESTS.inc(app=app_name, method=request.method, route=path, status=status)
+            HTTP_LATENCY.observe(elapsed, app=app_name, method=request.method, route=path)
+
+    return http_metrics
@@ -0,0 +1,69 @@
+"""
+Phân trang keyset (cursor) cho các danh sách lớn.
+
+Mỗi trang lọc theo khóa sắp xếp của dòng cuối trang trước (ví dụ
+WHERE (timestamp, id) < (...)) thay vì OFFSET, nên trang thứ 1000 cũng
+tốn chi phí như trang đầu. Cursor là khóa đó được mã hóa base64 (JSON).
+"""
+
+import base64
+import json
+import os
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        raise ValueError("Giá trị cursor không hợp lệ")
+    return value
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Mã hóa khóa sắp xếp của dòng cuối trang thành cursor"""
+    payload = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple:
+    """Giải mã cursor thành tuple khóa sắp xếp; ValueError nếu cursor không hợp lệ"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Cursor không hợp lệ") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Cursor không hợp lệ")
+    return tuple(_decode_value(v) for v in values)
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Giới hạn kích thước trang trong khoảng [1, MAX_PAGE_SIZE]"""
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def make_page(rows: List[Dict], limit: int, key_fields: Sequence[str]) -> Dict:
+    """Tạo trang từ limit + 1 dòng đã truy vấn (dòng dư chỉ để biết còn trang sau)"""
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and items:
+        last = items[-1]
+        next_cursor = encode_cursor([last[field] for field in key_fields])
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
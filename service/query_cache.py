@@ -0,0 +1,110 @@
+"""
+Cache đọc xuyên (read-through) cho dữ liệu tham chiếu: giáo viên, lớp học, camera.
+
+Dữ liệu này thay đổi vài lần mỗi học kỳ nhưng dashboard đọc liên tục. Kết quả của
+các phương thức Repository được đánh dấu @cached(namespace) được giữ trong một
+TTLCache chung (REFERENCE_CACHE_SIZE phần tử, sống REFERENCE_CACHE_TTL giây) và bị
+xóa ngay khi các phương thức ghi gọi invalidate(namespace).
+
+- Mỗi lần đọc trả về bản sao nên người gọi sửa kết quả không làm hỏng cache
+- Kết quả rỗng ([]/None) không được lưu: execute_query cũng trả [] khi lỗi DB
+- Query đang chạy lúc có invalidate không ghi kết quả (có thể đã cũ) vào cache
+- REFERENCE_CACHE_TTL=0 để tắt cache
+"""
+
+import copy
+import functools
+import os
+import threading
+from typing import Callable, Dict
+
+from service.metrics import REGISTRY
+from service.ttl_cache import TTLCache
+
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_SIZE = int(os.getenv("REFERENCE_CACHE_SIZE", "2048"))
+
+# Namespace: teachers, classes, cameras, class_students (danh sách học sinh theo lớp)
+_cache = TTLCache(maxsize=REFERENCE_CACHE_SIZE, ttl=REFERENCE_CACHE_TTL)
+_MISSING = object()
+_lock = threading.Lock()
+_generations: Dict[str, int] = {}
+_invalidations: Dict[str, int] = {}
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "reference_cache_lookups_total", "Số lần đọc cache dữ liệu tham chiếu", ("namespace", "result")
+)
+REGISTRY.gauge(
+    "reference_cache_entries", "Số phần tử trong cache dữ liệu tham chiếu",
+    callback=lambda: len(_cache)
+)
+
+
+def _generation_of(namespaces) -> tuple:
+    return tuple(_generations.get(namespace, 0) for namespace in namespaces)
+
+
+def cached(*namespaces: str) -> Callable:
+    """Decorator cho phương thức đọc của Repository: lưu kết quả theo (namespace, tên hàm, tham số)
+
+    Kết quả ghép từ nhiều loại dữ liệu khai báo nhiều namespace; invalidate
+    bất kỳ namespace nào trong đó đều xóa kết quả.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        name = func.__qualname__
+        label = "+".join(namespaces)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if REFERENCE_CACHE_TTL <= 0:
+                return func(*args, **kwargs)
+            key = (namespaces, name, args, tuple(sorted(kwargs.items())))
+            value = _cache.get(key, _MISSING)
+            if value is not _MISSING:
+                CACHE_LOOKUPS.inc(namespace=label, result="hit")
+                return copy.deepcopy(value)
+            CACHE_LOOKUPS.inc(namespace=label, result="miss")
+
+            with _lock:
+                generation = _generation_of(namespaces)
+            value = func(*args, **kwargs)
+            if value:
+                with _lock:
+                    if _generation_of(namespaces) == generation:
+                        _cache.set(key, copy.deepcopy(value))
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(*namespaces: str) -> int:
+    """Xóa mọi kết quả đã lưu của các namespace (gọi sau khi ghi), trả về số phần tử đã xóa"""
+    with _lock:
+        for namespace in namespaces:
+            _generations[namespace] = _generations.get(namespace, 0) + 1
+            _invalidations[namespace] = _invalidations.get(namespace, 0) + 1
+        return _cache.delete_where(lambda key: any(namespace in namespaces for namespace in key[0]))
+
+
+def clear():
+    """Xóa toàn bộ cache dữ liệu tham chiếu"""
+    with _lock:
+        for namespace in list(_generations):
+            _generations[namespace] += 1
+        _cache.clear()
+
+
+def stats() -> Dict:
+    """Thống kê cache: hit/miss/hit_rate tổng, số phần tử và số lần invalidate theo namespace"""
+    result = _cache.stats()
+    with _lock:
+        result["invalidations"] = dict(_invalidations)
+    entries: Dict[str, int] = {}
+    for key, _ in _cache.items():
+        label = "+".join(key[0])
+        entries[label] = entries.get(label, 0) + 1
+    result["entries"] = entries
+    return result
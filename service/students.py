@@ -1,7 +1,11 @@
 from service.db_connection import db
+from service.metrics import instrument_repository
+from service.query_cache import invalidate
+from service.pagination import clamp_limit, decode_cursor, make_page
 from typing import List, Dict, Optional
 from datetime import date
 
+@instrument_repository
 class StudentsRepository:
     """Repository để trích xuất và quản lý dữ liệu học sinh"""
     
@@ -22,6 +26,33 @@ class StudentsRepository:
         """
         return db.execute_query(query)
     
+    @staticmethod
+    def get_students_page(limit: int = None, cursor: str = None) -> Dict:
+        """Lấy một trang học sinh theo tên (phân trang keyset theo full_name, student_id)"""
+        limit = clamp_limit(limit)
+        where = ""
+        params: tuple = ()
+        if cursor:
+            last_name, last_id = decode_cursor(cursor, 2)
+            where = "WHERE full_name > %s OR (full_name = %s AND student_id > %s)"
+            params = (last_name, last_name, last_id)
+        query = f"""
+            SELECT 
+                student_id,
+                full_name,
+                date_of_birth,
+                gender,
+                student_code,
+                class_id,
+                avatar_url
+            FROM students
+            {where}
+            ORDER BY full_name, student_id
+            LIMIT %s
+        """
+        results = db.execute_query(query, params + (limit + 1,))
+        return make_page(results, limit, ('full_name', 'student_id'))
+    
     @staticmethod
     def get_student_by_id(student_id: int) -> Optional[Dict]:
         """Lấy học sinh theo ID"""
@@ -134,8 +165,38 @@ class StudentsRepository:
         """
         params = (full_name, date_of_birth, gender, student_code, class_id, avatar_url)
         _, last_id = db.execute_update(query, params)
+        invalidate('class_students')
         return last_id
     
+    @staticmethod
+    def create_student_many(records: List[Dict]) -> List[int]:
+        """Tạo nhiều học sinh trong một transaction (INSERT nhiều dòng, mỗi câu tối đa DB_BATCH_SIZE dòng)
+        
+        Mỗi record là dict với các khóa giống tham số của create_student.
+        Trả về ID theo thứ tự records, hoặc [] nếu lỗi (không học sinh nào được tạo).
+        """
+        query = """
+            INSERT INTO students 
+            (full_name, date_of_birth, gender, student_code, class_id, avatar_url)
+            VALUES {values}
+        """
+        rows = [
+            (
+                r['full_name'],
+                r.get('date_of_birth'),
+                r.get('gender'),
+                r.get('student_code'),
+                r['class_id'],
+                r.get('avatar_url')
+            )
+            for r in records
+        ]
+        if not rows:
+            return []
+        ids = db.execute_transaction(lambda cursor: db.insert_many(cursor, query, rows)) or []
+        invalidate('class_students')
+        return ids
+    
     @staticmethod
     def update_student(
         student_id: int,
@@ -175,6 +236,7 @@ class StudentsRepository:
         params.append(student_id)
         query = f"UPDATE students SET {', '.join(updates)} WHERE student_id = %s"
         affected_rows, _ = db.execute_update(query, tuple(params))
+        invalidate('class_students')
         return affected_rows > 0
     
     @staticmethod
@@ -182,6 +244,7 @@ class StudentsRepository:
         """Xóa học sinh"""
         query = "DELETE FROM students WHERE student_id = %s"
         affected_rows, _ = db.execute_update(query, (student_id,))
+        invalidate('class_students')
         return affected_rows > 0
     
     @staticmethod
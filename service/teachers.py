@@ -1,10 +1,16 @@
 from service.db_connection import db
+from service.metrics import instrument_repository
+from service.query_cache import cached, invalidate
+from service.batch_loader import BatchLoader, index_by, query_in
+from service.classes import ClassesRepository
 from typing import List, Dict, Optional
 
+@instrument_repository
 class TeachersRepository:
     """Repository để trích xuất và quản lý dữ liệu giáo viên"""
     
     @staticmethod
+    @cached('teachers')
     def get_all_teachers() -> List[Dict]:
         """Lấy tất cả giáo viên"""
         query = """
@@ -19,6 +25,7 @@ class TeachersRepository:
         return db.execute_query(query)
     
     @staticmethod
+    @cached('teachers')
     def get_teacher_by_id(teacher_id: int) -> Optional[Dict]:
         """Lấy giáo viên theo ID"""
         query = """
@@ -34,6 +41,7 @@ class TeachersRepository:
         return results[0] if results else None
     
     @staticmethod
+    @cached('teachers')
     def get_teacher_by_email(email: str) -> Optional[Dict]:
         """Lấy giáo viên theo email"""
         query = """
@@ -65,6 +73,7 @@ class TeachersRepository:
         return db.execute_query(query, (search_pattern, search_pattern))
     
     @staticmethod
+    @cached('classes')
     def get_teacher_classes(teacher_id: int) -> List[Dict]:
         """Lấy tất cả lớp học của một giáo viên"""
         query = """
@@ -80,6 +89,51 @@ class TeachersRepository:
         """
         return db.execute_query(query, (teacher_id,))
     
+    @staticmethod
+    def get_teachers_by_ids(teacher_ids: List[int]) -> Dict[int, Dict]:
+        """Lấy nhiều giáo viên bằng một query, trả về {teacher_id: giáo viên}"""
+        query = """
+            SELECT 
+                teacher_id,
+                full_name,
+                email,
+                phone
+            FROM teachers
+            WHERE teacher_id IN ({keys})
+        """
+        return index_by(query_in(query, teacher_ids), 'teacher_id')
+    
+    @staticmethod
+    def get_teachers_tree(teacher_ids: List[int] = None) -> List[Dict]:
+        """Lấy giáo viên → lớp học → học sinh (mỗi tầng một query dù có bao nhiêu giáo viên/lớp)
+        
+        teacher_ids=None lấy tất cả giáo viên.
+        """
+        if teacher_ids is None:
+            teachers = TeachersRepository.get_all_teachers()
+        else:
+            found = BatchLoader(TeachersRepository.get_teachers_by_ids).load_many(teacher_ids)
+            teachers = [teacher for teacher in found if teacher]
+        teacher_ids = [t['teacher_id'] for t in teachers]
+        classes = BatchLoader(ClassesRepository.get_classes_by_teacher_ids, default=list)
+        students = BatchLoader(ClassesRepository.get_students_by_class_ids, default=list)
+        
+        classes.want(*teacher_ids)
+        for teacher in teachers:
+            teacher['classes'] = classes.load(teacher['teacher_id'])
+            students.want(*[c['class_id'] for c in teacher['classes']])
+        for teacher in teachers:
+            for class_info in teacher['classes']:
+                class_info['students'] = students.load(class_info['class_id'])
+                class_info['student_count'] = len(class_info['students'])
+        return teachers
+    
+    @staticmethod
+    def get_teacher_tree(teacher_id: int) -> Optional[Dict]:
+        """Lấy một giáo viên kèm các lớp và học sinh của từng lớp"""
+        results = TeachersRepository.get_teachers_tree([teacher_id])
+        return results[0] if results else None
+    
     @staticmethod
     def create_teacher(
         full_name: str,
@@ -93,6 +147,7 @@ class TeachersRepository:
         """
         params = (full_name, email, phone)
         _, last_id = db.execute_update(query, params)
+        invalidate('teachers')
         return last_id
     
     @staticmethod
@@ -122,6 +177,7 @@ class TeachersRepository:
         params.append(teacher_id)
         query = f"UPDATE teachers SET {', '.join(updates)} WHERE teacher_id = %s"
         affected_rows, _ = db.execute_update(query, tuple(params))
+        invalidate('teachers', 'classes')
         return affected_rows > 0
     
     @staticmethod
@@ -129,6 +185,7 @@ class TeachersRepository:
         """Xóa giáo viên"""
         query = "DELETE FROM teachers WHERE teacher_id = %s"
         affected_rows, _ = db.execute_update(query, (teacher_id,))
+        invalidate('teachers', 'classes')
         return affected_rows > 0
     
     @staticmethod
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Cache trong bộ nhớ có giới hạn kích thước (LRU) và thời gian sống (TTL), an toàn đa luồng"""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get_locked(self, key: Hashable, now: float):
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _set_locked(self, key: Hashable, value: Any, now: float, ttl: Optional[float]):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (value, now + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Lấy giá trị (None/default nếu không có hoặc đã hết hạn)"""
+        with self._lock:
+            value = self._get_locked(key, self._clock())
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Lưu giá trị, đẩy phần tử ít dùng nhất ra nếu vượt maxsize"""
+        with self._lock:
+            self._set_locked(key, value, self._clock(), ttl)
+
+    def add(self, key: Hashable, value: Any = True, ttl: Optional[float] = None) -> bool:
+        """Chỉ lưu nếu key chưa có (kiểm tra và ghi nguyên tử); trả về True nếu đã lưu"""
+        with self._lock:
+            now = self._clock()
+            if self._get_locked(key, now) is not _MISSING:
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._set_locked(key, value, now, ttl)
+            return True
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Danh sách (key, value) còn hạn, không tính vào hit/miss"""
+        with self._lock:
+            now = self._clock()
+            return [
+                (key, value) for key, (value, expires_at) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def delete(self, key: Hashable) -> bool:
+        """Xóa một key"""
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Xóa mọi key thỏa predicate(key), trả về số key đã xóa"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        """Thống kê hit/miss của cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }